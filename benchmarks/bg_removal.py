@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+bg_removal.py
+Benchmark for background removal: the in-memory path used by
+webp_converter.bg_removal.remove_background versus the old PNG round-trip
+(encode input to PNG bytes, let rembg decode it, re-encode and decode the output).
+
+Each variant runs in a fresh subprocess so its peak RSS can be compared.
+The PNG codec overhead alone is also measured, which needs no model.
+
+Usage:
+    python benchmarks/bg_removal.py [--megapixels 12 24] [--runs 3] [--model u2netp]
+    python benchmarks/bg_removal.py --overhead-only
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from PIL import Image  # noqa: E402
+
+
+def make_photo(megapixels):
+    """Build a deterministic, photo-like RGBA image of roughly the given size (3:2)."""
+    height = int((megapixels * 1_000_000 / 1.5) ** 0.5)
+    width = int(height * 1.5)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 48)
+    mandel = Image.effect_mandelbrot((width, height), (-2.0, -1.2, 1.0, 1.2), 64)
+    return Image.merge("RGB", (gradient, noise, mandel)).convert("RGBA")
+
+
+def png_roundtrip_overhead(img):
+    """Time the two PNG encodes and two decodes the old path performed around inference."""
+    start = time.perf_counter()
+    with io.BytesIO() as buf:
+        img.save(buf, format="PNG")
+        data = buf.getvalue()
+    decoded = Image.open(io.BytesIO(data))
+    decoded.load()
+    with io.BytesIO() as buf:
+        decoded.save(buf, format="PNG")
+        data = buf.getvalue()
+    Image.open(io.BytesIO(data)).convert("RGBA")
+    return time.perf_counter() - start
+
+
+def remove_background_png(img, session):
+    """The pre-zero-copy implementation, kept here as the benchmark baseline."""
+    from rembg import remove
+    with io.BytesIO() as buf:
+        img.save(buf, format="PNG")
+        input_bytes = buf.getvalue()
+    output_bytes = remove(input_bytes, session=session)
+    return Image.open(io.BytesIO(output_bytes)).convert("RGBA")
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(variant, megapixels, runs, model):
+    from webp_converter.bg_removal import get_session, remove_background, warm_up
+
+    warm_up(model)
+    session = get_session(model)
+    img = make_photo(megapixels)
+    baseline = peak_rss_mb()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        if variant == "png-roundtrip":
+            remove_background_png(img, session)
+        else:
+            remove_background(img, model_name=model)
+        timings.append(time.perf_counter() - start)
+    return {"seconds_per_image": min(timings), "peak_rss_delta_mb": peak_rss_mb() - baseline}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark background removal paths.")
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[12.0, 24.0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", default="u2netp", help="rembg model (default: u2netp)")
+    parser.add_argument("--overhead-only", action="store_true", help="Only measure the PNG codec overhead")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    parser.add_argument("--child", choices=("png-roundtrip", "in-memory"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.megapixels[0], args.runs, args.model)))
+        return 0
+
+    results = []
+    for mp in args.megapixels:
+        img = make_photo(mp)
+        overhead = min(png_roundtrip_overhead(img) for _ in range(args.runs))
+        row = {"megapixels": mp, "png_overhead_seconds": round(overhead, 4)}
+        print(f"{mp:5.1f} MP  PNG round-trip overhead removed: {overhead * 1000:8.1f} ms/image")
+        if not args.overhead_only:
+            for variant in ("png-roundtrip", "in-memory"):
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", variant,
+                     "--megapixels", str(mp), "--runs", str(args.runs), "--model", args.model],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                stats = json.loads(proc.stdout.strip().splitlines()[-1])
+                row[variant] = stats
+                print(
+                    f"          {variant:14} {stats['seconds_per_image'] * 1000:8.1f} ms/image, "
+                    f"peak RSS +{stats['peak_rss_delta_mb']:.0f} MB"
+                )
+        results.append(row)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+startup.py
+Startup-time benchmark: parses `python -X importtime` output for each entry point
+and fails if the import budget is exceeded or a heavy dependency is loaded eagerly.
+
+Usage:
+    python benchmarks/startup.py [--budget-ms 250] [--runs 5] [--json report.json]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> command line (after the interpreter) that exercises the entry point.
+TARGETS = {
+    "webp-convert (import)": ["-c", "import webp_converter.cli"],
+    "webp-convert batch --help": ["-c", "from webp_converter.cli import main; main(['batch', '--help'])"],
+    "webp_converter.py --help": [os.path.join(REPO_ROOT, "webp_converter.py"), "--help"],
+}
+
+# Modules that must never be imported just to start up.
+HEAVY_MODULES = ("rembg", "onnxruntime", "questionary", "rich", "tqdm", "numpy")
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` lines into {module: (self_us, cumulative_us)} for top-level imports.
+    Returns:
+        (dict, int): Per-module timings and the total cumulative time in microseconds.
+    """
+    modules = {}
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        modules[name] = (int(self_us), int(cumulative_us))
+        if depth == 0:
+            total_us += int(cumulative_us)
+    return modules, total_us
+
+
+def measure(args, runs):
+    """Run a target several times and return the best total import time and the module table."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    best_us, best_modules = None, {}
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime"] + args,
+            cwd=REPO_ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        modules, total_us = parse_importtime(proc.stderr)
+        if best_us is None or total_us < best_us:
+            best_us, best_modules = total_us, modules
+    return best_us, best_modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure CLI startup import time.")
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Max import time per target (default: 250)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per target; the best one is reported")
+    parser.add_argument("--top", type=int, default=8, help="Number of slowest modules to show")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    report, failed = {}, False
+    for name, target in TARGETS.items():
+        total_us, modules = measure(target, args.runs)
+        heavy = sorted(m for m in modules if m in HEAVY_MODULES)
+        slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[: args.top]
+        over_budget = total_us / 1000 > args.budget_ms
+        failed = failed or over_budget or bool(heavy)
+        report[name] = {
+            "import_ms": round(total_us / 1000, 1),
+            "budget_ms": args.budget_ms,
+            "heavy_modules": heavy,
+            "slowest": [{"module": m, "self_ms": round(s / 1000, 1)} for m, (s, _) in slowest],
+        }
+        status = "FAIL" if over_budget or heavy else "ok"
+        print(f"{status:4} {name:28} {total_us / 1000:8.1f} ms (budget {args.budget_ms:.0f} ms)")
+        if heavy:
+            print(f"     eagerly imported: {', '.join(heavy)}")
+        for m, (s, _) in slowest:
+            print(f"     {s / 1000:7.1f} ms  {m}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
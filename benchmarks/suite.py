@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+suite.py
+Reproducible benchmark suite for the conversion pipeline.
+
+`run` generates a deterministic synthetic corpus (photos, flat graphics, alpha logos,
+huge images and animated GIFs at several resolutions), times each pipeline stage on
+its own and full runs of convert_to_webp_core and transform_logo, and writes JSON.
+`compare` diffs two result files and fails on regressions above a threshold.
+
+Usage:
+    python benchmarks/suite.py run --out results.json [--quick] [--with-bg]
+    python benchmarks/suite.py compare baseline.json results.json [--threshold 0.10]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+import PIL  # noqa: E402
+
+SEED = 20240501
+RESOLUTIONS = {"small": (640, 480), "medium": (1920, 1080), "large": (4000, 3000)}
+HUGE_RESOLUTION = (8000, 6000)
+
+
+def _noise(size, rng, scale=1):
+    """Deterministic grey noise, upscaled by `scale` to give it some structure."""
+    w, h = max(1, size[0] // scale), max(1, size[1] // scale)
+    img = Image.frombytes("L", (w, h), rng.randbytes(w * h))
+    return img.resize(size, Image.Resampling.BICUBIC) if scale > 1 else img
+
+
+def make_photo(size, rng):
+    gradient = Image.linear_gradient("L").resize(size)
+    texture = _noise(size, rng, scale=8).filter(ImageFilter.GaussianBlur(2))
+    grain = _noise(size, rng)
+    return Image.merge("RGB", (gradient, texture, Image.blend(texture, grain, 0.3)))
+
+
+def make_graphic(size, rng):
+    img = Image.new("RGB", size, (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+        x1, y1 = x0 + rng.randrange(20, size[0] // 3 + 21), y0 + rng.randrange(20, size[1] // 3 + 21)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        (draw.rectangle if rng.random() < 0.5 else draw.ellipse)((x0, y0, x1, y1), fill=color)
+    return img
+
+
+def make_logo(size, rng):
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    w, h = size
+    draw.ellipse((w * 0.1, h * 0.1, w * 0.9, h * 0.9), fill=(20, 90, 200, 255))
+    draw.rectangle((w * 0.3, h * 0.4, w * 0.7, h * 0.6), fill=(255, 255, 255, 200))
+    return img
+
+
+def make_animation(size, rng, frames=12):
+    base = make_graphic(size, rng)
+    return [base.rotate(i * 360 / frames).convert("P", palette=Image.Palette.ADAPTIVE) for i in range(frames)]
+
+
+def generate_corpus(corpus_dir, quick=False, huge=False):
+    """
+    Write the synthetic corpus to corpus_dir (skipping files that already exist).
+    Returns:
+        list: (case_name, path) tuples.
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = random.Random(SEED)
+    resolutions = {"small": RESOLUTIONS["small"]} if quick else dict(RESOLUTIONS)
+    if huge:
+        resolutions["huge"] = HUGE_RESOLUTION
+    cases = []
+    for res_name, size in resolutions.items():
+        for kind, maker, ext in (("photo", make_photo, "jpg"), ("graphic", make_graphic, "png"), ("logo", make_logo, "png")):
+            path = os.path.join(corpus_dir, f"{kind}-{res_name}.{ext}")
+            img = maker(size, rng)  # always generated so the RNG sequence does not depend on the cache
+            if not os.path.exists(path):
+                img.save(path, quality=90) if ext == "jpg" else img.save(path)
+            cases.append((f"{kind}-{res_name}", path))
+    anim_path = os.path.join(corpus_dir, "animated-small.gif")
+    frames = make_animation(RESOLUTIONS["small"], rng)
+    if not os.path.exists(anim_path):
+        frames[0].save(anim_path, save_all=True, append_images=frames[1:], duration=80, loop=0)
+    cases.append(("animated-small", anim_path))
+    return cases
+
+
+def timeit(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(timings), "min_s": min(timings), "runs": repeat}
+
+
+def bench_case(path, repeat, work_dir, with_bg):
+    from webp_converter.cli import convert_to_webp_core
+    from webp_converter.image_utils import has_transparency, prepare_for_webp
+    from webp_converter.image_transform import transform_logo
+
+    def decode():
+        with Image.open(path) as img:
+            img.load()
+            return img.copy()
+
+    img = decode()
+    rgba = img.convert("RGBA")
+    encoded = io.BytesIO()
+    prepare_for_webp(img).save(encoded, "WEBP", quality=80)
+    out_path = os.path.join(work_dir, "out.webp")
+
+    def write():
+        with open(out_path, "wb") as f:
+            f.write(encoded.getvalue())
+
+    def encode():
+        with io.BytesIO() as buf:
+            prepare_for_webp(img).save(buf, "WEBP", quality=80)
+
+    stages = {
+        "decode": decode,
+        "convert_rgba": lambda: img.convert("RGBA"),
+        "has_transparency": lambda: has_transparency(rgba),
+        "webp_encode": encode,
+        "write": write,
+        "convert_to_webp_core": lambda: convert_to_webp_core(path, out_path, quality=80),
+        "transform_logo": lambda: transform_logo(path, work_dir),
+    }
+    if with_bg:
+        from webp_converter.bg_removal import remove_background, warm_up
+        warm_up()
+        stages["remove_background"] = lambda: remove_background(rgba)
+    results = {name: timeit(fn, repeat) for name, fn in stages.items()}
+    results["pixels"] = img.width * img.height
+    results["output_bytes"] = len(encoded.getvalue())
+    return results
+
+
+def run(args):
+    from webp_converter.ui_helpers import get_console
+    get_console().quiet = True  # time the conversion, not the success panels
+    corpus_dir = args.corpus_dir or os.path.join(tempfile.gettempdir(), "webp-converter-bench-corpus")
+    cases = generate_corpus(corpus_dir, quick=args.quick, huge=args.huge)
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for case, path in cases:
+            results[case] = bench_case(path, args.repeat, work_dir, args.with_bg)
+            core = results[case]["convert_to_webp_core"]["median_s"]
+            print(f"{case:18} convert_to_webp_core {core * 1000:9.1f} ms", file=sys.stderr)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "seed": SEED,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}", file=sys.stderr)
+    return 0
+
+
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)["results"]
+    regressions = 0
+    print(f"{'case/stage':42} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for case, stages in sorted(current.items()):
+        for stage, stats in sorted(stages.items()):
+            old = baseline.get(case, {}).get(stage)
+            if not isinstance(stats, dict) or not isinstance(old, dict):
+                continue
+            before, after = old["median_s"], stats["median_s"]
+            change = (after - before) / before if before > 0 else 0.0
+            # Ignore sub-millisecond noise.
+            regressed = change > args.threshold and after - before > args.min_delta_ms / 1000
+            regressions += regressed
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{case + '/' + stage:42} {before * 1000:12.2f} {after * 1000:12.2f} {change:+8.1%}{flag}")
+    print(f"\n{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark suite for the WebP conversion pipeline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="Generate the corpus and time every stage")
+    run_parser.add_argument("--out", default="bench_results.json", help="Result file (default: bench_results.json)")
+    run_parser.add_argument("--corpus-dir", help="Where to keep the generated corpus (default: system temp dir)")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Timed runs per stage; the median is compared")
+    run_parser.add_argument("--quick", action="store_true", help="Only the small resolution")
+    run_parser.add_argument("--huge", action="store_true", help=f"Add {HUGE_RESOLUTION[0]}x{HUGE_RESOLUTION[1]} images")
+    run_parser.add_argument("--with-bg", action="store_true", help="Also time remove_background (needs a rembg model)")
+    compare_parser = sub.add_parser("compare", help="Compare results against a saved baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown (default: 0.10)")
+    compare_parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore smaller absolute changes")
+    args = parser.parse_args(argv)
+    return run(args) if args.command == "run" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+threads.py
+Thread-budget benchmark: batch throughput with background removal for different
+splits of the CPUs between worker processes and onnxruntime threads per worker,
+including the unbudgeted baseline (one worker per CPU, each with onnxruntime's
+default of one thread per core).
+
+The corpus mixes opaque photos (which go through the model) with already
+transparent cut-outs (which skip it) in the proportion given by --bg-share, so the
+effect of a partial background-removal load can be measured as well.
+
+Usage:
+    python benchmarks/threads.py [--images 48] [--bg-share 1.0 0.25] [--model u2netp] [--json threads.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from PIL import Image  # noqa: E402
+from suite import SEED, make_photo  # noqa: E402
+from webp_converter.parallel import CONVERT_MODE, run_parallel  # noqa: E402
+from webp_converter.threads import available_cpus, plan_threads  # noqa: E402
+
+
+def generate_corpus(corpus_dir, count, size, bg_share):
+    """Write count images: bg_share of them opaque JPEGs, the rest transparent PNGs."""
+    rng = random.Random(SEED)
+    opaque = round(count * bg_share)
+    paths = []
+    for i in range(count):
+        img = make_photo(size, rng)
+        if i < opaque:
+            path = os.path.join(corpus_dir, f"photo{i:03}.jpg")
+            img.save(path, quality=90)
+        else:
+            img = img.convert("RGBA")
+            img.putalpha(Image.linear_gradient("L").resize(size))
+            path = os.path.join(corpus_dir, f"cutout{i:03}.png")
+            img.save(path)
+        paths.append(path)
+    # Interleave so every worker sees the same mix.
+    rng.shuffle(paths)
+    return paths
+
+
+def splits(cpus):
+    """(label, workers, ort_threads) for the splits to compare."""
+    rows = [("unbudgeted", cpus, cpus)]
+    threads = 1
+    while threads <= cpus:
+        rows.append((f"{cpus // threads}x{threads}", cpus // threads, threads))
+        threads *= 2
+    return rows
+
+
+def run_split(paths, out_dir, workers, ort_threads, model):
+    """Convert the corpus once; return (steady-state images/s, wall seconds)."""
+    jobs = [(p, os.path.join(out_dir, os.path.splitext(os.path.basename(p))[0] + ".webp"), "convert") for p in paths]
+    start = time.perf_counter()
+    first = last = None
+    for result in run_parallel(jobs, CONVERT_MODE, workers=workers, ort_threads=ort_threads,
+                               remove_bg=True, bg_model=model):
+        if result["error"] is not None:
+            raise RuntimeError(f"{result['input']}: {result['error']}")
+        last = time.perf_counter()
+        first = first or last
+    # Workers load the model before their first job; leave that out of the rate.
+    rate = (len(jobs) - 1) / (last - first) if last > first else float("nan")
+    return rate, last - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CPU splits between workers and onnxruntime threads.")
+    parser.add_argument("--images", type=int, default=48, help="Images per run (default: 48)")
+    parser.add_argument("--size", type=int, nargs=2, default=[1024, 768], metavar=("W", "H"))
+    parser.add_argument("--bg-share", type=float, nargs="+", default=[1.0, 0.25],
+                        help="Shares of images that need background removal (default: 1.0 0.25)")
+    parser.add_argument("--cpus", type=int, default=available_cpus(), help="CPUs to split (default: all available)")
+    parser.add_argument("--model", default="u2netp", help="rembg model (default: u2netp)")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for share in args.bg_share:
+            corpus_dir = os.path.join(tmp, f"corpus-{share}")
+            os.makedirs(corpus_dir)
+            paths = generate_corpus(corpus_dir, args.images, tuple(args.size), share)
+            default = plan_threads(cpus=args.cpus, bg_share=share)
+            print(f"bg share {share:.2f} ({args.cpus} CPUs; plan_threads picks "
+                  f"{default['workers']}x{default['intra_op']})")
+            for label, workers, ort_threads in splits(args.cpus):
+                out_dir = os.path.join(tmp, f"out-{share}-{label}")
+                os.makedirs(out_dir)
+                rate, wall = run_split(paths, out_dir, workers, ort_threads, args.model)
+                print(f"  {label:>11}  {workers:3} workers x {ort_threads:2} threads  "
+                      f"{rate:7.2f} images/s  ({wall:.1f} s wall)")
+                results.append({
+                    "bg_share": share, "split": label, "workers": workers, "ort_threads": ort_threads,
+                    "images_per_second": round(rate, 3), "wall_seconds": round(wall, 3),
+                })
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cpus": args.cpus, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,7 +8,6 @@ setup(
     packages=find_packages(),
     install_requires=[
         'Pillow>=10.0.0',
-        'tqdm>=4.0.0',
         'rich>=13.0.0',
         'questionary>=2.0.0',
         'rembg>=2.0.0',
@@ -0,0 +1,66 @@
+from PIL import Image
+
+from webp_converter import Converter
+from webp_converter.autotune import QualityTarget
+from webp_converter.animation import is_animated
+from webp_converter.image_utils import convert_image_file
+
+
+def _write_mpo(path):
+    # A camera-style MPO: a main picture plus a smaller second one (not an animation).
+    main = Image.new("RGB", (64, 48), "red")
+    main.save(path, "MPO", save_all=True, append_images=[Image.new("RGB", (32, 24), "blue")])
+
+
+def _write_gif(path):
+    frames = [Image.new("RGB", (32, 32), color) for color in ("red", "green", "blue")]
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=100, loop=0)
+
+
+def test_multi_picture_jpeg_is_not_animated(tmp_path):
+    source = tmp_path / "camera.jpg"
+    _write_mpo(source)
+    with Image.open(source) as img:
+        assert img.n_frames == 2
+        assert not is_animated(img)
+
+
+def test_multi_picture_jpeg_converts_first_frame(tmp_path):
+    source, output = tmp_path / "camera.jpg", tmp_path / "camera.webp"
+    _write_mpo(source)
+    result = convert_image_file(str(source), str(output))
+    assert result["frames"] == 1
+    with Image.open(output) as img:
+        assert img.size == (64, 48)
+        assert not getattr(img, "is_animated", False)
+
+
+def test_converter_multi_picture_jpeg(tmp_path):
+    source = tmp_path / "camera.jpg"
+    _write_mpo(source)
+    _, record = Converter().convert(source.read_bytes())
+    assert record["frames"] == 1
+    assert (record["width"], record["height"]) == (64, 48)
+
+
+def test_animated_gif_stays_animated(tmp_path):
+    source, output = tmp_path / "anim.gif", tmp_path / "anim.webp"
+    _write_gif(source)
+    result = convert_image_file(str(source), str(output))
+    assert result["frames"] == 3
+    with Image.open(output) as img:
+        assert img.n_frames == 3
+    assert result["skipped_options"] == []
+
+
+def test_animations_report_ignored_options(tmp_path):
+    source, output = tmp_path / "anim.gif", tmp_path / "anim.webp"
+    _write_gif(source)
+    target = QualityTarget("bytes", 10000)
+    result = convert_image_file(str(source), str(output), remove_bg=True, target=target)
+    assert result["bg_skipped"] is False
+    assert result["skipped_options"] == ["remove_bg", "target"]
+    _, record = Converter(remove_bg=True, max_size=16, target=target, warm=False).convert(source.read_bytes())
+    assert record["frames"] == 3
+    assert record["bg_skipped"] is False
+    assert record["skipped_options"] == ["remove_bg", "max_size", "target"]
@@ -0,0 +1,72 @@
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from webp_converter import Converter
+from webp_converter.autotune import QualityTarget, search_quality
+from webp_converter.classify import NEAR_LOSSLESS_MIN_PSNR, choose_encoding, psnr, resolve_encoding
+
+
+def _blocks(colors):
+    """512x512 of flat 16x16 blocks in `colors` random colours (low edge density)."""
+    rng = random.Random(1)
+    palette = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(colors)]
+    img = Image.new("RGB", (512, 512))
+    draw = ImageDraw.Draw(img)
+    for i in range(32 * 32):
+        x, y = i % 32 * 16, i // 32 * 16
+        draw.rectangle((x, y, x + 15, y + 15), fill=palette[i % colors])
+    return img
+
+
+def _close_shades():
+    """A flat graphic with ~400 colours that differ by a few levels (palette-friendly)."""
+    rng = random.Random(1)
+    img = Image.new("RGB", (512, 512), (250, 250, 250))
+    draw = ImageDraw.Draw(img)
+    for _ in range(800):
+        x, y, v = rng.randrange(480), rng.randrange(480), rng.randrange(400)
+        draw.rectangle((x, y, x + rng.randrange(4, 30), y + rng.randrange(4, 30)),
+                       fill=(60 + v % 20 * 2, 90 + v // 20 * 2, 150))
+    return img
+
+
+def _encode(img):
+    prepared, options, decision = resolve_encoding(img)
+    with io.BytesIO() as buf:
+        prepared.save(buf, "WEBP", **options)
+        data = buf.getvalue()
+    with Image.open(io.BytesIO(data)) as decoded:
+        return decision, psnr(img, decoded.convert(img.mode))
+
+
+def test_many_distinct_colours_are_not_palette_reduced():
+    img = _blocks(1024)
+    assert choose_encoding(img)["mode"] == "near-lossless"
+    decision, score = _encode(img)
+    assert decision["mode"] == "lossless"
+    assert score == 100.0
+
+
+def test_near_lossless_keeps_fidelity():
+    decision, score = _encode(_close_shades())
+    assert decision["mode"] == "near-lossless"
+    assert score >= NEAR_LOSSLESS_MIN_PSNR
+
+
+def test_lossless_record_reports_effort_not_quality():
+    buf = io.BytesIO()
+    _blocks(64).save(buf, "PNG")
+    _, record = Converter(lossless="auto").convert(buf.getvalue())
+    assert record["mode"] == "lossless"
+    assert record["quality"] is None
+    assert record["effort"] == 80
+
+
+def test_psnr_target_is_met_by_the_same_measure():
+    img = _close_shades()
+    quality, data = search_quality(img, QualityTarget("psnr", 33))
+    assert 0 < quality < 100
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert psnr(img, decoded.convert("RGB")) >= 33
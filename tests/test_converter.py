@@ -0,0 +1,62 @@
+import io
+
+import pytest
+from PIL import Image
+
+from webp_converter import Converter
+
+
+def _png(size=(64, 48), color="red"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _decode(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.format, img.size
+
+
+@pytest.mark.parametrize("kind", ["bytes", "bytearray", "file", "pil"])
+def test_accepts_bytes_files_and_pil_images(kind):
+    png = _png()
+    source = {
+        "bytes": png,
+        "bytearray": bytearray(png),
+        "file": io.BytesIO(png),
+        "pil": Image.open(io.BytesIO(png)),
+    }[kind]
+    data, record = Converter().convert(source, name="red.png")
+    assert _decode(data) == ("WEBP", (64, 48))
+    assert record["name"] == "red.png"
+    assert record["new_size"] == len(data)
+    assert record["original_size"] == (None if kind == "pil" else len(png))
+    assert record["frames"] == 1
+    assert "encode" in record["timings"]
+
+
+def test_max_size_scales_down():
+    data, record = Converter(max_size=32).convert(_png((64, 48)))
+    assert _decode(data) == ("WEBP", (32, 24))
+    assert (record["width"], record["height"]) == (32, 24)
+
+
+def test_rejects_unsupported_input():
+    with pytest.raises(ValueError):
+        Converter().convert(b"not an image")
+    with pytest.raises(TypeError):
+        Converter().convert(42)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_convert_many_reports_errors_in_order(workers):
+    sources = (("bad.png" if i % 3 == 1 else f"{i}.png", b"junk" if i % 3 == 1 else _png()) for i in range(7))
+    results = list(Converter().convert_many(sources, workers=workers))
+    assert [record["name"] for _, record in results] == [
+        "bad.png" if i % 3 == 1 else f"{i}.png" for i in range(7)
+    ]
+    for i, (data, record) in enumerate(results):
+        if i % 3 == 1:
+            assert data is None and record["error"]
+        else:
+            assert record["error"] is None and _decode(data)[0] == "WEBP"
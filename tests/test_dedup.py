@@ -0,0 +1,56 @@
+import json
+import os
+
+from PIL import Image
+
+from webp_converter.batch import main
+
+
+def _inputs(folder, names=("a.png", "b.png", "c.png")):
+    folder.mkdir()
+    img = Image.linear_gradient("L").resize((64, 48)).convert("RGB")
+    for name in names:
+        img.save(folder / name)
+    return folder
+
+
+def _records(report):
+    return [json.loads(line) for line in report.read_text().splitlines()]
+
+
+def _run(*argv):
+    main([*map(str, argv), "-w", "1", "--dedup", "--dedup-index", "idx.jsonl"])
+
+
+def test_duplicates_in_one_batch_are_converted_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _inputs(tmp_path / "in")
+    _run("in", "-o", "out", "--report", "r1")
+    records = _records(tmp_path / "r1")
+    assert records[-1]["converted"] == 1
+    assert records[-1]["deduplicated"] == 2
+    # The bare-filename index was written next to the working directory.
+    assert len((tmp_path / "idx.jsonl").read_text().splitlines()) == 1
+    sizes = {(tmp_path / "out" / name).stat().st_size for name in ("a.webp", "b.webp", "c.webp")}
+    assert len(sizes) == 1
+
+
+def test_later_batch_reuses_the_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _inputs(tmp_path / "in")
+    _run("in", "-o", "out", "--report", "r1")
+    _inputs(tmp_path / "more", names=("d.png",))
+    _run("more", "-o", "out2", "--report", "r2")
+    totals = _records(tmp_path / "r2")[-1]
+    assert totals["converted"] == 0
+    assert totals["deduplicated"] == 1
+    assert (tmp_path / "out2" / "d.webp").exists()
+
+
+def test_hardlink_rerun_leaves_no_temp_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _inputs(tmp_path / "in")
+    for report in ("r1", "r2"):
+        _run("in", "-o", "out", "--link", "hardlink", "--overwrite", "overwrite", "--report", report)
+    assert all(r.get("error") is None for r in _records(tmp_path / "r2")[:-1])
+    assert sorted(os.listdir(tmp_path / "out")) == ["a.webp", "b.webp", "c.webp"]
@@ -0,0 +1,79 @@
+import json
+
+from PIL import Image
+
+from webp_converter.batch import main
+from webp_converter.journal import load_journal
+
+
+def _inputs(folder, count=4):
+    folder.mkdir()
+    for i in range(count):
+        Image.new("RGB", (40, 30), (i * 60, 0, 0)).save(folder / f"{i}.png")
+    return folder
+
+
+def _run(*argv):
+    main([*map(str, argv), "-w", "1"])
+
+
+def _totals(report):
+    return json.loads(report.read_text().splitlines()[-1])
+
+
+def test_fresh_run_replaces_an_old_journal(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inputs = _inputs(tmp_path / "in")
+    journal = tmp_path / "j.jsonl"
+    _run(inputs, "-o", tmp_path / "first", "--journal", journal, "--report", tmp_path / "r1")
+    _run(inputs, "-o", tmp_path / "second", "--journal", journal, "--report", tmp_path / "r2")
+    state = load_journal(str(journal))
+    assert str(tmp_path / "second") in state.argv
+    assert len(state.planned) == 4
+    assert all("second" in output for output in state.planned)
+    assert sum(1 for line in journal.read_text().splitlines() if '"state": "batch"' in line) == 1
+
+
+def test_resume_skips_intact_outputs_and_redoes_the_rest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inputs = _inputs(tmp_path / "in")
+    out, journal = tmp_path / "out", tmp_path / "j.jsonl"
+    _run(inputs, "-o", out, "--journal", journal, "--report", tmp_path / "r1")
+    # Simulate a crash after two completions: drop the later completions and the end marker.
+    lines = journal.read_text().splitlines()
+    kept, completed = [], 0
+    for line in lines:
+        state = json.loads(line)["state"]
+        if state == "completed":
+            completed += 1
+            if completed > 2:
+                continue
+        if state != "finished":
+            kept.append(line)
+    journal.write_text("\n".join(kept) + "\n")
+    # One of the two "completed" outputs is corrupted without changing its size.
+    first = json.loads(next(line for line in kept if '"completed"' in line))["output"]
+    data = bytearray(open(first, "rb").read())
+    data[-1] ^= 0xFF
+    open(first, "wb").write(data)
+
+    _run("--resume", journal, "--report", tmp_path / "r2")
+    totals = _totals(tmp_path / "r2")
+    assert totals["total"] == 4
+    assert totals["converted"] == 4
+    assert totals["resumed"] == 1
+    assert totals["failed"] == 0
+    assert len(list(out.glob("*.webp"))) == 4
+    assert not list(out.glob("*.tmp"))
+
+
+def test_resume_from_another_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _inputs(tmp_path / "in")
+    _run("in", "-o", "out", "--journal", "j.jsonl", "--report", "r1")
+    elsewhere = tmp_path / "elsewhere"
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    _run("--resume", "../j.jsonl", "--report", tmp_path / "r2")
+    assert _totals(tmp_path / "r2")["resumed"] == 4
+    assert not (elsewhere / "out").exists()
@@ -0,0 +1,42 @@
+import json
+import os
+
+from PIL import Image
+
+from webp_converter.batch import main
+from webp_converter.manifest import ConversionManifest
+
+
+def _inputs(folder, count=3):
+    folder.mkdir()
+    for i in range(count):
+        Image.new("RGB", (40, 30), (i * 60, 0, 0)).save(folder / f"{i}.png")
+    return folder
+
+
+def _totals(report):
+    return json.loads(report.read_text().splitlines()[-1])
+
+
+def test_incremental_run_skips_unchanged_inputs(tmp_path):
+    inputs, out = _inputs(tmp_path / "in"), tmp_path / "out"
+    argv = [str(inputs), "-o", str(out), "-w", "1", "--incremental", "--report"]
+    main([*argv, str(tmp_path / "r1")])
+    assert _totals(tmp_path / "r1")["converted"] == 3
+    st = os.stat(inputs / "1.png")
+    os.utime(inputs / "1.png", ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    main([*argv, str(tmp_path / "r2")])
+    totals = _totals(tmp_path / "r2")
+    assert totals["converted"] == 1
+    assert totals["skipped"] == 2
+
+
+def test_manifest_is_saved_during_the_run(tmp_path):
+    inputs, out = _inputs(tmp_path / "in"), tmp_path / "out"
+    manifest = ConversionManifest(str(out), save_every=2, save_interval=3600)
+    for i in range(3):
+        manifest.record(str(inputs / f"{i}.png"), str(out / f"{i}.webp"), {"quality": 80})
+    # Two records were flushed without save(); the third waits for the next flush.
+    assert len(ConversionManifest(str(out)).entries) == 2
+    manifest.save()
+    assert len(ConversionManifest(str(out)).entries) == 3
@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+import signal
+
+from PIL import Image
+
+from webp_converter import threads
+from webp_converter.parallel import CONVERT_MODE, process_file, run_parallel
+
+
+def _jobs(tmp_path, count):
+    source = tmp_path / "noise.png"
+    Image.effect_noise((400, 400), 64).convert("RGB").save(source)
+    out = tmp_path / "out"
+    out.mkdir()
+    # A generator: the pool is fed as it goes, so jobs remain after a worker dies.
+    return (
+        (str(source), str(out / f"{i:03}.webp"), "convert")
+        for i in range(count)
+    )
+
+
+def test_killed_worker_fails_its_files_only(tmp_path):
+    count = 120
+    results = []
+    killed = None
+    for result in run_parallel(_jobs(tmp_path, count), CONVERT_MODE, workers=2):
+        results.append(result)
+        if killed is None:
+            killed = multiprocessing.active_children()[0].pid
+            os.kill(killed, signal.SIGKILL)
+    assert len(results) == count
+    assert [r["output"] for r in results] == sorted(r["output"] for r in results)
+    failed = [r for r in results if r["error"] is not None]
+    assert failed, "killing a worker should fail the files it had"
+    assert all(r["error"].startswith("Worker failed") for r in failed)
+    # The pool was replaced: files after the failure converted normally.
+    assert results[-1]["error"] is None
+    assert os.path.exists(results[-1]["output"])
+
+
+def test_reencoded_webp_is_skipped_on_rerun(tmp_path):
+    source, output = tmp_path / "photo.webp", tmp_path / "out.webp"
+    Image.effect_noise((200, 200), 64).convert("RGB").save(source, quality=100)
+    first = process_file(str(source), str(output), "copy", CONVERT_MODE, quality=50, reencode_webp=10)
+    assert first["error"] is None and first.get("reencoded")
+    again = process_file(str(source), str(output), "copy", CONVERT_MODE, quality=50, reencode_webp=10)
+    assert again["link"] == "unchanged"
+    assert again["new_size"] == output.stat().st_size
+    os.utime(source)
+    changed = process_file(str(source), str(output), "copy", CONVERT_MODE, quality=50, reencode_webp=10)
+    assert changed.get("reencoded")
+
+
+def test_single_worker_applies_the_thread_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(threads, "_ort_threads", None)
+    for name in threads.THREAD_ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    results = list(run_parallel(_jobs(tmp_path, 1), CONVERT_MODE, workers=1, ort_threads=3))
+    assert results[0]["error"] is None
+    assert threads._ort_threads == (3, 1)
+    assert os.environ["OMP_NUM_THREADS"] == "3"
+
+
+def test_image_over_the_memory_budget_runs_alone(tmp_path):
+    results = list(run_parallel(_jobs(tmp_path, 8), CONVERT_MODE, workers=2, memory_budget=1, trace=True))
+    assert [r["error"] for r in results] == [None] * 8
+    spans = []
+    for r in results:
+        stages = r["trace"]["stages"]
+        spans.append((stages[0]["ts"], max(s["ts"] + s["dur"] for s in stages)))
+    spans.sort()
+    assert all(end <= start for (_, end), (start, _) in zip(spans, spans[1:]))
@@ -0,0 +1,34 @@
+from PIL import Image
+
+from webp_converter.scanner import ScanQueue, iter_jobs, scan_images
+
+
+def _tree(root):
+    (root / "sub").mkdir(parents=True)
+    (root / "out").mkdir()
+    for path in ("a.png", "sub/b.jpg", "out/a.webp"):
+        Image.new("RGB", (8, 8)).save(root / path)
+    (root / "notes.txt").write_text("not an image")
+
+
+def test_output_dir_inside_the_inputs_is_not_scanned(tmp_path):
+    _tree(tmp_path)
+    assert sorted(scan_images(str(tmp_path))) == sorted(
+        str(tmp_path / p) for p in ("a.png", "sub/b.jpg", "out/a.webp")
+    )
+    jobs = list(iter_jobs([str(tmp_path)], str(tmp_path / "out")))
+    assert sorted(job[0] for job in jobs) == [str(tmp_path / "a.png"), str(tmp_path / "sub" / "b.jpg")]
+    assert all(action == "convert" for _, _, action in jobs)
+
+
+def test_relative_output_dir_is_excluded(tmp_path, monkeypatch):
+    _tree(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    assert sorted(job[0] for job in iter_jobs(["."], "out")) == ["./a.png", "./sub/b.jpg"]
+
+
+def test_scan_queue_hands_over_every_job(tmp_path):
+    _tree(tmp_path)
+    scan = ScanQueue(iter_jobs([str(tmp_path)], str(tmp_path / "out")), maxsize=1)
+    assert len(list(scan)) == 2
+    assert scan.done and scan.found == 2
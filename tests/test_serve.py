@@ -0,0 +1,82 @@
+import io
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+
+from PIL import Image
+
+from webp_converter.serve import ConversionHandler, ConversionService, Metrics, TCPConversionServer
+
+
+def _png(color="red"):
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_service_recovers_from_a_killed_worker():
+    service = ConversionService(workers=2)
+    try:
+        service.warm_up()
+        assert service.submit(_png()).result(60)["error"] is None
+        os.kill(multiprocessing.active_children()[0].pid, signal.SIGKILL)
+        time.sleep(0.5)
+        results = [service.submit(_png(color)).result(60) for color in ("red", "green", "blue")]
+        assert [r["error"] for r in results] == [None, None, None]
+        assert service.restarts == 1
+        assert service.healthy()
+    finally:
+        service.close()
+
+
+def test_healthz_reports_a_broken_pool():
+    service = ConversionService(workers=1)
+    try:
+        service.warm_up()
+        assert service.healthy()
+        os.kill(multiprocessing.active_children()[0].pid, signal.SIGKILL)
+        time.sleep(0.5)
+        assert not service.healthy()
+        # The check started a new pool.
+        assert service.healthy()
+        assert service.submit(_png()).result(60)["error"] is None
+    finally:
+        service.close()
+
+
+class _DeadWorkerService:
+    """Answers every request the way ConversionService does when a worker died under it."""
+
+    metrics = Metrics()
+
+    def submit(self, data, **options):
+        future = Future()
+        future.set_result({"error": "Worker failed: pool broke", "worker_failed": True})
+        return future
+
+    def healthy(self):
+        return False
+
+
+def test_worker_failures_are_server_errors():
+    server = TCPConversionServer(("127.0.0.1", 0), ConversionHandler)
+    server.configure(_DeadWorkerService(), 1 << 20, 80, False, False, False)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for request in (urllib.request.Request(f"{base}/convert", data=_png()), f"{base}/healthz"):
+            try:
+                urllib.request.urlopen(request, timeout=30)
+                raise AssertionError("expected an HTTP error")
+            except urllib.error.HTTPError as e:
+                assert e.code == 503
+                assert e.headers["Retry-After"] == "1"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,47 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from PIL import Image
+
+from webp_converter.watch import watch
+
+
+def _wait_for(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_watch_survives_a_killed_worker(tmp_path):
+    source, out = tmp_path / "in", tmp_path / "out"
+    source.mkdir()
+    results = []
+    stopping = threading.Event()
+    errors = []
+
+    def run():
+        try:
+            watch(str(source), str(out), results.append, workers=2, settle=0.1, poll=0.1, stop=stopping.is_set)
+        except Exception as e:  # surfaced by the assertion below
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    try:
+        Image.new("RGB", (32, 32), "red").save(source / "a.png")
+        _wait_for(lambda: results or errors)
+        os.kill(multiprocessing.active_children()[0].pid, signal.SIGKILL)
+        time.sleep(0.5)
+        Image.new("RGB", (32, 32), "blue").save(source / "b.png")
+        _wait_for(lambda: any(r["input"].endswith("b.png") for r in results) or errors)
+    finally:
+        stopping.set()
+        thread.join(60)
+    assert not errors
+    assert all(r["error"] is None for r in results)
+    converted = [r for r in results if r["input"].endswith("b.png")]
+    assert os.path.exists(converted[0]["output"])
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+from PIL import Image
+
+from webp_converter import writer
+from webp_converter.parallel import CONVERT_MODE, finish_result, process_file
+from webp_converter.writer import AsyncWriter, PendingWrites, atomic_write
+
+
+def test_failed_write_keeps_the_old_file(tmp_path, monkeypatch):
+    path = tmp_path / "out.webp"
+    path.write_bytes(b"old")
+
+    def broken_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(writer.os, "replace", broken_replace)
+    with pytest.raises(OSError):
+        atomic_write(str(path), b"new contents")
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["out.webp"]
+
+
+def test_atomic_write_sets_mtime(tmp_path):
+    path = tmp_path / "out.webp"
+    atomic_write(str(path), b"data", fsync=True, mtime_ns=10 ** 18)
+    assert path.read_bytes() == b"data"
+    assert path.stat().st_mtime_ns == 10 ** 18
+
+
+def test_async_write_errors_reach_the_result(tmp_path):
+    async_writer = AsyncWriter()
+    pending = PendingWrites(async_writer)
+    pending.write(str(tmp_path / "ok.webp"), b"ok")
+    pending.write(str(tmp_path / "missing" / "bad.webp"), b"bad")
+    try:
+        assert "missing" in pending.wait()
+    finally:
+        async_writer.close()
+    assert os.listdir(tmp_path) == ["ok.webp"]
+
+
+def test_undecodable_input_leaves_no_output(tmp_path):
+    source, output = tmp_path / "broken.png", tmp_path / "out" / "broken.webp"
+    Image.new("RGB", (64, 64), "red").save(source)
+    source.write_bytes(source.read_bytes()[:60])
+    async_writer = AsyncWriter()
+    try:
+        result = finish_result(
+            process_file(str(source), str(output), "convert", CONVERT_MODE, writer=async_writer)
+        )
+    finally:
+        async_writer.close()
+    assert result["error"] is not None
+    assert not os.listdir(tmp_path / "out")
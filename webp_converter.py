@@ -7,7 +7,7 @@ import sys
 import os
 import argparse
 from PIL import Image
-from .image_utils import save_image_with_transparency
+from webp_converter.image_utils import save_image_with_transparency
 
 def convert_to_webp(input_path: str, output_path: str = None) -> None:
     """
@@ -25,7 +25,6 @@ def convert_to_webp(input_path: str, output_path: str = None) -> None:
 
     try:
         with Image.open(input_path) as img:
-            img = img.convert('RGBA')
             if not output_path:
                 base, _ = os.path.splitext(input_path)
                 output_path = base + '.webp'
@@ -0,0 +1,7 @@
+"""
+webp_converter
+Convert images to WebP from the command line or, through Converter, in memory.
+"""
+from .converter import Converter
+
+__all__ = ["Converter"]
@@ -0,0 +1,68 @@
+"""
+animation.py
+Animated GIF/APNG to animated WebP. Frames are streamed through the encoder one at
+a time, keeping per-frame durations and the loop count.
+"""
+import io
+from .timing import stage
+
+# Encoder options for animations (passed through to Pillow's WebP writer):
+# minimize_size - slower, smaller output; kmin/kmax - min/max distance between
+# key frames; allow_mixed - choose lossy or lossless per frame.
+ANIMATION_OPTIONS = ("minimize_size", "kmin", "kmax", "allow_mixed")
+# Formats whose extra frames are animation frames. Multi-frame MPO (camera JPEGs with
+# a second picture) and multi-page TIFF are not animations: only their first frame is used.
+ANIMATED_FORMATS = ("GIF", "PNG", "WEBP")
+
+
+def is_animated(img):
+    """Return True if img is an animation (an animated GIF, APNG or WebP)."""
+    return getattr(img, "is_animated", False) and img.format in ANIMATED_FORMATS
+
+
+class _FrameDurations(list):
+    """
+    Duration list that reads each frame's duration from the source while it is
+    positioned on that frame. Pillow's WebP writer looks up duration[i] right after
+    encoding frame i, so no separate pass over the frames is needed.
+    """
+
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+
+    def __getitem__(self, index):
+        return self.source.info.get("duration", 0)
+
+
+def encode_animated_webp(img, quality=80, lossless=False, **options):
+    """
+    Encode every frame of an animated image into an animated WebP in memory.
+    Only the current frame (and the encoder's previous canvas) is held at a time.
+    Args:
+        img (PIL.Image.Image): Open animated image (GIF, APNG, WebP, ...).
+        quality (int): WebP quality (0-100).
+        lossless (bool or str): If True, use lossless WebP; 'auto' lets the encoder pick
+            lossy or lossless per frame (allow_mixed).
+        options: minimize_size, kmin, kmax and allow_mixed (see ANIMATION_OPTIONS).
+    Returns:
+        bytes: The encoded animation.
+    """
+    options = {k: v for k, v in options.items() if k in ANIMATION_OPTIONS and v is not None}
+    if lossless == "auto":
+        lossless = False
+        options.setdefault("allow_mixed", True)
+    # A GIF without a NETSCAPE loop extension plays once; APNG always records its loop count.
+    loop = img.info.get("loop", 1)
+    with stage("encode"), io.BytesIO() as buf:
+        img.save(
+            buf,
+            "WEBP",
+            save_all=True,
+            duration=_FrameDurations(img),
+            loop=loop,
+            quality=quality,
+            lossless=lossless,
+            **options,
+        )
+        return buf.getvalue()
@@ -0,0 +1,190 @@
+"""
+autotune.py
+Automatic WebP quality selection: bisect the quality setting with in-memory encodes
+to hit a target byte size or a target similarity (SSIM/PSNR) to the source.
+Chosen qualities are memoized per content hash in an append-only cache file.
+"""
+import io
+import os
+import json
+import math
+from collections import namedtuple
+from PIL import Image, ImageChops
+
+# metric is 'bytes', 'ssim' or 'psnr'.
+QualityTarget = namedtuple("QualityTarget", ["metric", "value"])
+
+METRICS = ("bytes", "ssim", "psnr")
+# Similarity is measured on a copy scaled to fit within this many pixels per side.
+METRIC_MAX_SIDE = 2048
+
+_cache = None
+
+
+def parse_size(text):
+    """Parse a byte size such as '150000', '150K' or '1.5M'."""
+    text = text.strip().upper().rstrip("B")
+    multiplier = 1
+    if text and text[-1] in "KMG":
+        multiplier = 1024 ** ("KMG".index(text[-1]) + 1)
+        text = text[:-1]
+    size = int(float(text) * multiplier)
+    if size <= 0:
+        raise ValueError("Target size must be positive.")
+    return size
+
+
+def encode_webp(img, quality, lossless=False, **kwargs):
+    """Encode an image to WebP in memory and return the bytes."""
+    with io.BytesIO() as buf:
+        img.save(buf, "WEBP", quality=quality, lossless=lossless, **kwargs)
+        return buf.getvalue()
+
+
+def _metric_image(img):
+    if max(img.size) > METRIC_MAX_SIDE:
+        img = img.copy()
+        img.thumbnail((METRIC_MAX_SIDE, METRIC_MAX_SIDE), Image.Resampling.BILINEAR)
+    return img.convert("RGB")
+
+
+def _metric_pixels(img):
+    import numpy as np
+    return np.asarray(_metric_image(img), dtype=np.float32)
+
+
+def _box_mean(x, k):
+    import numpy as np
+    c = np.pad(x, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+    return (c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)
+
+
+def ssim(reference, candidate, window=7):
+    """Mean SSIM of the luma channels of two equally sized arrays from _metric_pixels."""
+    luma = (0.299, 0.587, 0.114)
+    a = reference @ luma
+    b = candidate @ luma
+    k = max(1, min(window, *a.shape))
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mu_a, mu_b = _box_mean(a, k), _box_mean(b, k)
+    var_a = _box_mean(a * a, k) - mu_a ** 2
+    var_b = _box_mean(b * b, k) - mu_b ** 2
+    cov = _box_mean(a * b, k) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+
+def psnr(reference, candidate):
+    """
+    PSNR in dB over all bands of two images of the same size and mode; identical
+    images return 100. Also used by classify for its near-lossless check.
+    """
+    histogram = ImageChops.difference(reference, candidate).histogram()
+    squared = sum(n * (i % 256) ** 2 for i, n in enumerate(histogram))
+    mse = squared / (reference.width * reference.height * len(reference.getbands()))
+    if mse == 0:
+        return 100.0
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def default_cache_path():
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "webp-converter", "quality-cache.jsonl")
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        _cache = {}
+        try:
+            with open(default_cache_path(), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        _cache[entry["key"]] = entry["quality"]
+                    except (ValueError, KeyError):
+                        continue
+        except OSError:
+            pass
+    return _cache
+
+
+def _remember(key, quality):
+    _load_cache()[key] = quality
+    path = default_cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One short line per O_APPEND write, so concurrent workers do not interleave.
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "quality": quality}) + "\n")
+    except OSError:
+        pass
+
+
+def search_quality(img, target, **kwargs):
+    """
+    Bisect quality 0-100 for an image.
+    For 'bytes' the highest quality whose output fits target.value is chosen; for
+    'ssim'/'psnr' the lowest quality whose output reaches target.value.
+    If no quality meets the target, the closest end of the range is used.
+    Args:
+        img (PIL.Image.Image): Image, already in its WebP-ready mode.
+        target (QualityTarget): What to aim for.
+        kwargs: Extra WebP encoder options.
+    Returns:
+        (int, bytes): Chosen quality and the encoded WebP data.
+    """
+    if target.metric not in METRICS:
+        raise ValueError(f"Unknown quality target metric: {target.metric}")
+    reference = None
+    if target.metric == "ssim":
+        try:
+            reference = _metric_pixels(img)
+        except ImportError:
+            raise ImportError("NumPy is required for SSIM quality targets (pip install numpy).")
+    elif target.metric == "psnr":
+        reference = _metric_image(img)
+
+    def meets(data):
+        if target.metric == "bytes":
+            return len(data) <= target.value
+        with Image.open(io.BytesIO(data)) as decoded:
+            if target.metric == "ssim":
+                return ssim(reference, _metric_pixels(decoded)) >= target.value
+            return psnr(reference, _metric_image(decoded)) >= target.value
+
+    best = None
+    lo, hi = 0, 100
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        data = encode_webp(img, mid, **kwargs)
+        if meets(data):
+            best = (mid, data)
+            if target.metric == "bytes":
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        elif target.metric == "bytes":
+            hi = mid - 1
+        else:
+            lo = mid + 1
+    if best is None:
+        fallback = 0 if target.metric == "bytes" else 100
+        best = (fallback, encode_webp(img, fallback, **kwargs))
+    return best
+
+
+def tune_quality(img, content_hash, target, **kwargs):
+    """
+    Like search_quality, but reuses the quality found for the same content and target
+    on an earlier run instead of searching again.
+    Returns:
+        (int, bytes, bool): Chosen quality, encoded data and whether a search was run.
+    """
+    key = f"{content_hash}:{target.metric}:{target.value}:{json.dumps(kwargs, sort_keys=True)}"
+    cached = _load_cache().get(key)
+    if cached is not None:
+        return cached, encode_webp(img, cached, **kwargs), False
+    quality, data = search_quality(img, target, **kwargs)
+    _remember(key, quality)
+    return quality, data, True
@@ -0,0 +1,447 @@
+"""
+batch.py
+Headless, non-interactive batch conversion with machine-readable results.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from itertools import chain
+from .autotune import QualityTarget, parse_size
+from .classify import AUTO
+from .dedup import DedupIndex, Deduplicator
+from .journal import BatchJournal, load_journal
+from .links import LINK_MODES
+from .manifest import ConversionManifest
+from .parallel import CONVERT_MODE, run_parallel
+from .scanner import ScanQueue, iter_jobs
+from .timing import TraceWriter
+from .variants import parse_variant_specs, srcset_path
+from .writer import remove_stale_temps
+
+OVERWRITE_POLICIES = ("skip", "overwrite", "error")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="webp-convert batch",
+        description="Convert images to WebP without any prompts.",
+        epilog="Example: webp-convert batch photos/ logo.png -o out/ --quality 75 --workers 8",
+    )
+    parser.add_argument("inputs", nargs="*", help="Input image files and/or folders")
+    parser.add_argument("-o", "--output-dir", help="Output directory for all files (required)")
+    parser.add_argument("-q", "--quality", type=int, default=80, help="WebP quality 0-100 (default: 80)")
+    compression = parser.add_mutually_exclusive_group()
+    compression.add_argument("--lossless", action="store_true", help="Use lossless WebP")
+    compression.add_argument(
+        "--auto-compression",
+        action="store_true",
+        help="Pick lossy, near-lossless or lossless per image from its content (photos lossy, "
+        "logos/screenshots/diagrams lossless or palette-reduced); the choice is in each record's 'mode'",
+    )
+    auto = parser.add_mutually_exclusive_group()
+    auto.add_argument(
+        "--target-size",
+        help="Pick the highest quality whose output fits this size, e.g. 150K (overrides --quality)",
+    )
+    auto.add_argument(
+        "--target-ssim",
+        type=float,
+        help="Pick the lowest quality reaching this SSIM to the source, e.g. 0.95 (needs NumPy)",
+    )
+    auto.add_argument(
+        "--target-psnr",
+        type=float,
+        help="Pick the lowest quality reaching this PSNR in dB, e.g. 40 (needs NumPy)",
+    )
+    parser.add_argument("--remove-bg", action="store_true", help="Remove image backgrounds (uses AI)")
+    parser.add_argument(
+        "--bg-model",
+        help="rembg model for --remove-bg, e.g. u2net, u2netp (lighter), isnet-general-use (default: rembg's default)",
+    )
+    parser.add_argument(
+        "--variants",
+        help="Responsive variants from one decode, e.g. '320,640,1280,orig' or '640:60,640:85,orig:lossless' "
+        "(WIDTH[:QUALITY][:lossless]); writes a .srcset.json manifest per image",
+    )
+    parser.add_argument(
+        "--overwrite",
+        choices=OVERWRITE_POLICIES,
+        default="skip",
+        help="What to do when an output file already exists (default: skip)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip inputs unchanged since the last run (tracked in a manifest in the output dir)",
+    )
+    parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="With --incremental, also compare content hashes when size/mtime changed",
+    )
+    parser.add_argument(
+        "--link",
+        choices=tuple(LINK_MODES),
+        default="auto",
+        help="How existing WebP inputs and --dedup duplicates are placed in the output: auto (copy-on-write "
+        "reflink, else copy), "
+        "hardlink (hardlink, else reflink, else copy) or copy (default: auto). Outputs that already match "
+        "the input's size and mtime are left alone",
+    )
+    parser.add_argument(
+        "--reencode-webp",
+        type=float,
+        metavar="PERCENT",
+        help="Re-encode existing WebP inputs with --quality/--lossless when that saves more than PERCENT. "
+        "Outputs re-encoded by an earlier run (which keep their input's mtime) are left alone",
+    )
+    parser.add_argument(
+        "--anim-minimize-size",
+        action="store_true",
+        help="For animated inputs (GIF, APNG), spend more time for smaller animated WebPs",
+    )
+    parser.add_argument(
+        "--anim-kmin", type=int, metavar="N", help="Minimum distance between key frames in animated WebPs",
+    )
+    parser.add_argument(
+        "--anim-kmax", type=int, metavar="N", help="Maximum distance between key frames in animated WebPs",
+    )
+    parser.add_argument(
+        "--anim-mixed",
+        action="store_true",
+        help="Let the encoder pick lossy or lossless per frame of an animation",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Convert byte-identical inputs once and hardlink/reflink/copy the result to the other outputs; "
+        "results are also reused across batches through a persistent index",
+    )
+    parser.add_argument(
+        "--dedup-index",
+        metavar="FILE",
+        help="Index file for --dedup (default: ~/.cache/webp-converter/dedup-index.jsonl)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        help="Estimated peak memory allowed across workers, e.g. 4G; images that would exceed it wait, "
+        "and an image larger than the whole budget runs alone",
+    )
+    parser.add_argument(
+        "--max-pixels",
+        type=int,
+        help="Reject images with more pixels than this (0 = no limit); replaces Pillow's "
+        "decompression-bomb limit (default: Pillow's)",
+    )
+    parser.add_argument(
+        "--fsync",
+        action="store_true",
+        help="Sync each output to disk before it replaces the old file (slower, survives power loss)",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int,
+        help="Number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--ort-threads", type=int, metavar="N",
+        help="onnxruntime threads per worker for background removal "
+        "(default: the cores left per worker; without --workers, runs CPU count / N workers)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("ndjson", "json"),
+        default="ndjson",
+        help="ndjson streams one record per line; json writes a single document at the end",
+    )
+    parser.add_argument("--report", default="-", help="Where to write results (default: stdout)")
+    parser.add_argument(
+        "--journal",
+        metavar="FILE",
+        help="Log every job's planned/started/completed state (with output size and checksum) to FILE, "
+        "so an interrupted batch can be resumed with --resume (an existing FILE is replaced)",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="JOURNAL",
+        help="Continue the batch recorded in JOURNAL with its original inputs and settings: completed "
+        "jobs are skipped, interrupted ones redone, and totals cover the whole batch. Runtime options "
+        "such as --workers may be given again. Relative paths are taken from the directory the "
+        "batch was started in",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Record per-stage timings: Chrome trace JSON (chrome://tracing, Perfetto), or JSON lines "
+        "if FILE ends in .jsonl; prints a p50/p95/p99 summary to stderr",
+    )
+    return parser
+
+
+def _status(result):
+    if result["error"] is not None:
+        return "error"
+    return "copied" if result["action"] == "copy" and not result.get("reencoded") else "converted"
+
+
+def _apply_overwrite_policy(files_to_convert, policy, skipped):
+    """
+    Yield the jobs to run; outputs that already exist are reported through skipped(record).
+    """
+    for input_path, output_path, action in files_to_convert:
+        if policy == "overwrite" or not os.path.exists(output_path):
+            yield (input_path, output_path, action)
+            continue
+        record = {"input": input_path, "output": output_path, "action": action}
+        if policy == "skip":
+            record.update(status="skipped", error=None)
+        else:
+            record.update(status="error", error="Output file already exists.")
+        skipped(record)
+
+
+def _apply_manifest(files_to_convert, manifest, params, skipped):
+    """
+    Yield stale jobs (to run); up-to-date outputs are reported through skipped(record).
+    Stale outputs are always regenerated, whatever the overwrite policy.
+    """
+    for input_path, output_path, action in files_to_convert:
+        if manifest.is_up_to_date(input_path, output_path, dict(params, action=action)):
+            skipped({"input": input_path, "output": output_path, "action": action, "status": "skipped", "error": None})
+        else:
+            yield (input_path, output_path, action)
+
+
+def _new_totals():
+    return {
+        "type": "totals", "total": 0, "converted": 0, "copied": 0, "deduplicated": 0, "skipped": 0,
+        "failed": 0, "original_bytes": 0, "output_bytes": 0,
+    }
+
+
+def _add_to_totals(totals, record):
+    totals["total"] += 1
+    totals["failed" if record["status"] == "error" else record["status"]] += 1
+    totals["original_bytes"] += record.get("original_size", 0)
+    totals["output_bytes"] += record.get("new_size", 0)
+
+
+def run_batch(args, stream):
+    """
+    Run a batch described by parsed arguments and write result records to stream.
+    Inputs are scanned on a background thread while earlier files convert; with
+    ndjson output no per-file state is kept, so memory does not grow with the tree.
+    Returns:
+        int: Process exit code (0 if every file succeeded or was skipped, 1 otherwise).
+    """
+    start = time.perf_counter()
+    totals = _new_totals()
+    records = [] if args.format == "json" else None
+    state = args.resume_state
+    journal = None
+    if state is not None:
+        # Completed jobs count towards this run's totals; the rest are redone.
+        state.verify()
+        for entry in state.completed.values():
+            _add_to_totals(totals, entry)
+        totals["resumed"] = len(state.completed)
+        for output_path in state.interrupted():
+            remove_stale_temps(output_path)
+        journal = BatchJournal(args.resume, resume=True)
+    elif args.journal:
+        journal = BatchJournal(args.journal, argv=args.argv)
+
+    def emit(record):
+        _add_to_totals(totals, record)
+        if records is not None:
+            records.append(record)
+        else:
+            stream.write(json.dumps(dict(type="file", **record)) + "\n")
+            stream.flush()
+
+    inputs = []
+    for p in args.inputs:
+        if os.path.exists(p):
+            inputs.append(p)
+        else:
+            emit({"input": p, "output": None, "action": None, "status": "error", "error": "Input path does not exist."})
+    os.makedirs(args.output_dir, exist_ok=True)
+    if state is not None and state.plan_done:
+        scan = None
+        files_to_convert = iter(())
+    else:
+        scan = ScanQueue(iter_jobs(inputs, args.output_dir))
+        files_to_convert = iter(scan)
+    params = {
+        "quality": args.quality,
+        "lossless": args.lossless,
+        "remove_bg": args.remove_bg,
+        "bg_model": args.bg_model,
+    }
+    if args.target:
+        params["target"] = args.target
+    if args.reencode_webp is not None:
+        params["reencode_webp"] = args.reencode_webp
+    animation = {
+        "minimize_size": args.anim_minimize_size or None,
+        "kmin": args.anim_kmin,
+        "kmax": args.anim_kmax,
+        "allow_mixed": args.anim_mixed or None,
+    }
+    animation = {k: v for k, v in animation.items() if v is not None}
+    if animation:
+        params["animation"] = animation
+    if args.variants:
+        params["variants"] = args.variants
+        # Variant jobs are tracked by their manifest; the variant files are named after it.
+        files_to_convert = (
+            (i, srcset_path(o) if a == "convert" else o, a) for i, o, a in files_to_convert
+        )
+    if state is not None:
+        # Only the part of the tree the interrupted run had not planned yet.
+        files_to_convert = (job for job in files_to_convert if not state.known(job[1]))
+
+    def finish(record):
+        emit(record)
+        if journal is not None:
+            journal.completed(record)
+
+    manifest = None
+    if args.incremental:
+        manifest = ConversionManifest(args.output_dir, use_hash=args.hash)
+        jobs = _apply_manifest(files_to_convert, manifest, params, finish)
+    else:
+        jobs = _apply_overwrite_policy(files_to_convert, args.overwrite, finish)
+    if journal is not None:
+        jobs = journal.plan(jobs)
+    if state is not None:
+        # Planned jobs that never completed run again, whatever the overwrite policy.
+        jobs = chain(state.pending_jobs(), jobs)
+
+    def done(record):
+        finish(record)
+        if manifest is not None and record["error"] is None:
+            manifest.record(record["input"], record["output"], dict(params, action=record["action"]))
+
+    dedup = None
+    if args.dedup:
+        dedup = Deduplicator(params, index=DedupIndex(args.dedup_index), methods=LINK_MODES[args.link])
+        jobs = dedup.filter(jobs, done)
+    if journal is not None:
+        jobs = journal.start(jobs)
+
+    trace_writer = TraceWriter(args.trace) if args.trace else None
+    try:
+        for result in run_parallel(
+            jobs,
+            CONVERT_MODE,
+            workers=args.workers,
+            ort_threads=args.ort_threads,
+            fsync=args.fsync,
+            memory_budget=args.memory_budget,
+            max_pixels=args.max_pixels,
+            link=args.link,
+            trace=bool(trace_writer),
+            **params,
+        ):
+            trace = result.pop("trace", None)
+            if trace_writer is not None and trace is not None:
+                trace_writer.add(trace)
+            result["status"] = _status(result)
+            done(result)
+            if dedup is not None:
+                for record in dedup.finish(result):
+                    done(record)
+    finally:
+        if scan is not None:
+            scan.close()
+        if manifest is not None:
+            manifest.save()
+        if trace_writer is not None:
+            trace_writer.close()
+            print(trace_writer.summary(), file=sys.stderr)
+
+    totals["elapsed"] = round(time.perf_counter() - start, 3)
+    if journal is not None:
+        journal.finished(totals)
+        journal.close()
+    if records is None:
+        stream.write(json.dumps(totals) + "\n")
+    else:
+        json.dump({"files": records, "totals": totals}, stream, indent=2)
+        stream.write("\n")
+    stream.flush()
+    return 1 if totals["failed"] else 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args = parser.parse_args(argv)
+    args.resume_state = None
+    if args.resume:
+        if args.inputs or args.output_dir:
+            parser.error("--resume takes the inputs and output directory from the journal")
+        journal_path = os.path.abspath(args.resume)
+        try:
+            state = load_journal(journal_path)
+        except (OSError, ValueError) as e:
+            parser.error(f"--resume: cannot read journal: {e}")
+        if state.cwd is not None:
+            # The journal's argv and planned paths may be relative to where the batch started.
+            try:
+                os.chdir(state.cwd)
+            except OSError as e:
+                parser.error(f"--resume: cannot return to the batch's directory: {e}")
+        # The original command line, with anything given now taking precedence.
+        args = parser.parse_args(state.argv + argv)
+        args.resume = journal_path
+        args.resume_state = state
+    elif not args.inputs or not args.output_dir:
+        parser.error("inputs and -o/--output-dir are required (or --resume JOURNAL)")
+    args.argv = argv
+    if not 0 <= args.quality <= 100:
+        parser.error("--quality must be between 0 and 100")
+    for flag in ("workers", "ort_threads"):
+        if getattr(args, flag) is not None and getattr(args, flag) < 1:
+            parser.error(f"--{flag.replace('_', '-')} must be at least 1")
+    if args.reencode_webp is not None and not 0 <= args.reencode_webp < 100:
+        parser.error("--reencode-webp must be between 0 and 100")
+    for flag in ("anim_kmin", "anim_kmax"):
+        if getattr(args, flag) is not None and getattr(args, flag) < 0:
+            parser.error(f"--{flag.replace('_', '-')} must be 0 or more")
+    if args.max_pixels is not None and args.max_pixels < 0:
+        parser.error("--max-pixels must be 0 or more")
+    if args.memory_budget:
+        try:
+            args.memory_budget = parse_size(args.memory_budget)
+        except ValueError:
+            parser.error(f"--memory-budget: invalid size '{args.memory_budget}'")
+    args.target = None
+    try:
+        if args.target_size:
+            args.target = QualityTarget("bytes", parse_size(args.target_size))
+    except ValueError:
+        parser.error(f"--target-size: invalid size '{args.target_size}'")
+    if args.target_ssim is not None:
+        if not 0 < args.target_ssim <= 1:
+            parser.error("--target-ssim must be between 0 and 1")
+        args.target = QualityTarget("ssim", args.target_ssim)
+    if args.target_psnr is not None:
+        args.target = QualityTarget("psnr", args.target_psnr)
+    if args.auto_compression:
+        if args.variants:
+            parser.error("--auto-compression cannot be combined with --variants (use WIDTH:lossless items)")
+        args.lossless = AUTO
+    if args.dedup and args.variants:
+        parser.error("--dedup cannot be combined with --variants")
+    if args.variants:
+        try:
+            args.variants = parse_variant_specs(args.variants, quality=args.quality, lossless=args.lossless)
+        except ValueError as e:
+            parser.error(f"--variants: {e}")
+    if args.report == "-":
+        return run_batch(args, sys.stdout)
+    with open(args.report, "w", encoding="utf-8") as stream:
+        return run_batch(args, stream)
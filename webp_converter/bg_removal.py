@@ -3,17 +3,53 @@ bg_removal.py
 Reusable utility for removing image backgrounds using rembg.
 """
 from PIL import Image
-from rembg import remove
-import io
+from rembg import new_session, remove
+from .threads import session_options
+from .timing import stage
 
-def remove_background(input_image: Image.Image) -> Image.Image:
+# One rembg/ONNX session per model, created lazily and kept for the life of the
+# process (each worker process of a parallel batch builds its own).
+_sessions = {}
+
+
+def get_session(model_name=None):
+    """
+    Return the cached rembg session for a model, creating it on first use.
+    Args:
+        model_name (str): rembg model name (e.g. 'u2net', 'u2netp', 'isnet-general-use').
+            None uses rembg's default model.
+    The session uses the thread budget set by threads.apply_thread_budget, if any.
+    """
+    session = _sessions.get(model_name)
+    if session is None:
+        options = {"sess_opts": session_options()}
+        session = new_session(model_name, **options) if model_name else new_session(**options)
+        _sessions[model_name] = session
+    return session
+
+
+def warm_up(model_name=None):
+    """
+    Create the session and run one tiny inference so the first real image pays
+    for inference only (model download, ONNX graph setup and allocation happen here).
+    """
+    remove(Image.new("RGB", (64, 64)), session=get_session(model_name))
+
+
+def close_sessions():
+    """Drop all cached sessions so their ONNX resources can be released."""
+    _sessions.clear()
+
+
+def remove_background(input_image, model_name=None) -> Image.Image:
     """
-    Remove the background from a PIL Image using rembg.
+    Remove the background from a PIL Image (or NumPy array) using rembg.
+    The image is handed to the model in memory, with no PNG encode/decode round-trips.
     Returns a new PIL Image with background removed (RGBA).
     """
-    # rembg expects bytes, so convert PIL Image to bytes
-    with io.BytesIO() as buf:
-        input_image.save(buf, format="PNG")
-        input_bytes = buf.getvalue()
-    output_bytes = remove(input_bytes)
-    return Image.open(io.BytesIO(output_bytes)).convert("RGBA")
+    if not isinstance(input_image, Image.Image):
+        input_image = Image.fromarray(input_image)
+    session = get_session(model_name)
+    with stage("remove_background"):
+        output = remove(input_image, session=session)
+    return output if output.mode == "RGBA" else output.convert("RGBA")
@@ -0,0 +1,68 @@
+"""
+budget.py
+Memory admission for batches: estimate each job's peak memory from the image header
+(without decoding) and cap what runs at once, plus a configurable max-pixels guard
+that replaces Pillow's global decompression-bomb limit.
+"""
+from PIL import Image
+
+# Rough peak bytes per pixel on top of the decoded image: an RGBA working copy
+# and the WebP encoder's ARGB/YUV buffers.
+WORKING_BYTES_PER_PIXEL = 10
+# Background removal keeps RGBA input and output copies, the mask and the composite.
+BG_REMOVAL_BYTES_PER_PIXEL = 16
+
+
+def read_header(path):
+    """Return (width, height, mode) from the image header; pixel data is not decoded."""
+    with Image.open(path) as img:
+        return img.width, img.height, img.mode
+
+
+def configure_max_pixels(limit):
+    """
+    Replace Pillow's decompression-bomb limit with our own guard (see check_pixels).
+    Args:
+        limit (int): Maximum pixels per image; 0 for no limit; None keeps Pillow's default.
+    """
+    if limit is not None:
+        Image.MAX_IMAGE_PIXELS = None
+
+
+def check_pixels(path, limit):
+    """
+    Raise ValueError if the image at path has more than limit pixels (0/None: no limit).
+    """
+    if not limit:
+        return
+    width, height, _ = read_header(path)
+    check_dimensions(width, height, limit)
+
+
+def check_dimensions(width, height, limit):
+    """Raise ValueError if width x height is more than limit pixels (0/None: no limit)."""
+    if limit and width * height > limit:
+        raise ValueError(
+            f"Image is {width}x{height} ({width * height:,} pixels), above the limit of {limit:,} pixels."
+        )
+
+
+def estimate_job_bytes(path, action="convert", remove_bg=False):
+    """
+    Estimate the peak memory of one job in bytes. Copies cost nothing; unreadable
+    headers count as 0 so the job runs and reports its own error.
+    """
+    if action == "copy":
+        return 0
+    try:
+        width, height, mode = read_header(path)
+    except Exception:
+        return 0
+    try:
+        decoded = Image.getmodebands(mode)
+    except Exception:
+        decoded = 4
+    per_pixel = decoded + WORKING_BYTES_PER_PIXEL
+    if remove_bg:
+        per_pixel += BG_REMOVAL_BYTES_PER_PIXEL
+    return width * height * per_pixel
@@ -0,0 +1,157 @@
+"""
+classify.py
+"auto" compression: picks lossy, near-lossless or lossless WebP per image from cheap
+statistics of a downsampled copy (unique colours, edge density, alpha usage).
+"""
+import io
+from PIL import Image, ImageChops
+from .autotune import psnr
+
+AUTO = "auto"
+# Statistics are taken on a nearest-neighbour sample no larger than this on either side
+# (nearest-neighbour keeps the original colours; no blends are introduced).
+SAMPLE_SIDE = 256
+# Edge density is the share of neighbouring pixels that differ. Logos, diagrams and
+# screenshots are mostly flat (well under half); photos and scans are well over.
+GRAPHIC_EDGE_DENSITY = 0.5
+NEAR_LOSSLESS_EDGE_DENSITY = 0.4
+LOSSLESS_MAX_COLORS = 256
+NEAR_LOSSLESS_MAX_COLORS = 4096
+# Near-lossless keeps the 256-colour palette only if it is at least this faithful to the
+# source (about what lossy q80 reaches on graphics). Otherwise trial encodes of the sample
+# decide: lossless if it is no larger than lossy, else lossy.
+NEAR_LOSSLESS_MIN_PSNR = 45.0
+# Palette quantisation bands soft shadows and anti-aliased cut-outs; above this share of
+# partially transparent pixels, flat graphics are kept fully lossless instead.
+SOFT_ALPHA_LIMIT = 0.05
+# WebP method (effort 0-6) and, for lossless, effort 0-100 (Pillow's quality argument).
+# Pillow's defaults, method 6, save a few percent at several times the encode time.
+LOSSY_METHOD = 4
+LOSSLESS_METHOD = 4
+LOSSLESS_EFFORT = 80
+
+
+def _sample(img):
+    scale = max(1, -(-max(img.size) // SAMPLE_SIDE))
+    if scale > 1:
+        img = img.resize((max(1, img.width // scale), max(1, img.height // scale)), Image.Resampling.NEAREST)
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    return img
+
+
+def image_stats(img):
+    """
+    Return colors (unique colours in the sample, None if above NEAR_LOSSLESS_MAX_COLORS),
+    edge_density (share of horizontally/vertically adjacent pixels that differ) and
+    soft_alpha (share of partially transparent pixels).
+    """
+    sample = _sample(img)
+    colors = sample.getcolors(NEAR_LOSSLESS_MAX_COLORS)
+    gray = sample.convert("L") if sample.mode != "L" else sample
+    total = gray.width * gray.height
+    same = 0
+    for dx, dy in ((1, 0), (0, 1)):
+        same += ImageChops.difference(gray, ImageChops.offset(gray, dx, dy)).histogram()[0]
+    soft_alpha = 0.0
+    if sample.mode == "RGBA":
+        alpha = sample.getchannel("A").histogram()
+        soft_alpha = sum(alpha[1:255]) / total
+    return {
+        "colors": len(colors) if colors is not None else None,
+        "edge_density": round(1 - same / (2 * total), 3),
+        "soft_alpha": round(soft_alpha, 3),
+    }
+
+
+def choose_encoding(img, quality=80):
+    """
+    Classify an image and pick its WebP encoding.
+    Args:
+        img (PIL.Image.Image): Decoded image (any mode).
+        quality (int): Quality to use if the image is encoded lossy.
+    Returns:
+        dict: mode ('lossy', 'near-lossless' or 'lossless'), method, quality (lossy)
+        or effort (lossless modes) and the statistics it was based on (see image_stats).
+        Near-lossless is only a candidate here; apply_encoding checks its fidelity.
+    """
+    stats = image_stats(img)
+    colors, edges = stats["colors"], stats["edge_density"]
+    if edges <= GRAPHIC_EDGE_DENSITY and colors is not None and colors <= LOSSLESS_MAX_COLORS:
+        mode = "lossless"
+    elif edges <= NEAR_LOSSLESS_EDGE_DENSITY and colors is not None:
+        mode = "near-lossless" if stats["soft_alpha"] <= SOFT_ALPHA_LIMIT else "lossless"
+    else:
+        mode = "lossy"
+    if mode == "lossy":
+        return {"mode": mode, "quality": quality, "method": LOSSY_METHOD, **stats}
+    if mode == "near-lossless":
+        # Kept for the lossy fallback in apply_encoding.
+        stats["lossy_quality"] = quality
+    return {"mode": mode, "effort": LOSSLESS_EFFORT, "method": LOSSLESS_METHOD, **stats}
+
+
+def apply_encoding(img, decision):
+    """
+    Return (image, save options) for a decision from choose_encoding. Near-lossless
+    reduces the image to a 256-colour palette (no dithering) and encodes it losslessly,
+    which WebP stores compactly with its colour-indexing transform. If the palette
+    image falls below NEAR_LOSSLESS_MIN_PSNR, it is dropped and the source is encoded
+    lossless or lossy (see _fallback); decision is updated to match.
+    """
+    if decision["mode"] == "near-lossless":
+        reduced = None
+        if img.mode in ("RGB", "RGBA"):
+            method = Image.Quantize.FASTOCTREE if img.mode == "RGBA" else Image.Quantize.MEDIANCUT
+            reduced = img.quantize(256, method=method, dither=Image.Dither.NONE).convert(img.mode)
+        if reduced is not None and psnr(img, reduced) >= NEAR_LOSSLESS_MIN_PSNR:
+            img = reduced
+        else:
+            decision.update(_fallback(img, decision))
+    if decision["mode"] == "lossy":
+        return img, {"lossless": False, "quality": decision["quality"], "method": decision["method"]}
+    return img, {"lossless": True, "quality": decision["effort"], "method": decision["method"]}
+
+
+def _fallback(img, decision):
+    """
+    Lossless if a trial encode is no larger than lossy at the given quality, else lossy.
+    The trials use the whole image: text and thin lines do not survive the sample.
+    """
+    sizes = {}
+    for mode, options in (
+        ("lossless", {"lossless": True, "quality": decision["effort"], "method": LOSSLESS_METHOD}),
+        ("lossy", {"lossless": False, "quality": decision["lossy_quality"], "method": LOSSY_METHOD}),
+    ):
+        with io.BytesIO() as buf:
+            img.save(buf, "WEBP", **options)
+            sizes[mode] = buf.tell()
+    if sizes["lossless"] <= sizes["lossy"]:
+        return {"mode": "lossless"}
+    return {"mode": "lossy", "quality": decision["lossy_quality"], "method": LOSSY_METHOD}
+
+
+def resolve_encoding(img, quality=80):
+    """
+    Classify and prepare a WebP-ready image in one step.
+    Returns:
+        (PIL.Image.Image, dict, dict): Image to encode, save options (lossless,
+        quality, method) and the decision from choose_encoding.
+    """
+    decision = choose_encoding(img, quality)
+    img, options = apply_encoding(img, decision)
+    return img, options, decision
+
+
+def compression_record(lossless, decision=None):
+    """
+    Result-record fields describing the compression used (decision: from choose_encoding).
+    For lossless modes in auto mode, quality is None and effort holds the encoder effort.
+    """
+    if decision is None:
+        return {"mode": "lossless" if lossless else "lossy"}
+    stats = {k: decision[k] for k in ("colors", "edge_density", "soft_alpha")}
+    record = {"mode": decision["mode"], "method": decision["method"], "classification": stats}
+    if decision["mode"] != "lossy":
+        record.update(quality=None, effort=decision["effort"])
+    return record
@@ -2,17 +2,16 @@ import os
 os.environ["OMP_DISPLAY_ENV"] = "FALSE"
 import sys
 import os
-import shutil
+from functools import lru_cache
+from itertools import chain, islice
 from pathlib import Path
-from PIL import Image
-from rich.console import Console
-from rich.panel import Panel
-from tqdm import tqdm
-import questionary
-from questionary import Style
 from .ui_helpers import show_success, show_error, show_warning, show_info, ask_overwrite
 from .image_utils import save_image_with_transparency
-from .bg_removal import remove_background
+from .parallel import default_workers, resize_and_save as _resave, run_parallel
+from .classify import AUTO
+from .dashboard import BatchDashboard
+from .links import LINK_MODES, place_file
+from .scanner import ScanQueue, iter_jobs, output_path_for, scan_images
 
 # ANSI color codes for retro terminal style
 CYAN = "\033[96m"
@@ -69,7 +68,7 @@ def get_downloads_dir() -> str:
 
 
 from .ui_helpers import show_success, show_error, show_warning, show_info, ask_overwrite
-from .image_utils import save_image_with_transparency
+from .image_utils import save_image_with_transparency, convert_image_file
 
 
 def convert_to_webp_core(
@@ -78,35 +77,37 @@ def convert_to_webp_core(
     quality: int = 80,
     remove_bg: bool = False,
     lossless: bool = False,
+    target=None,
 ) -> bool:
     """
     Core image-to-WebP conversion logic. No user interaction or file existence checks.
+    If target (an autotune.QualityTarget) is given, quality is chosen automatically.
     Returns True on success, False on error.
     """
     try:
-        from .bg_removal import remove_background
-        with Image.open(input_path) as img:
-            img = img.convert("RGBA")
-            def has_transparency(image):
-                if image.mode in ("RGBA", "LA"):
-                    alpha = image.getchannel("A")
-                    return alpha.getextrema()[0] < 255
-                return False
-            if remove_bg and not has_transparency(img):
-                img = remove_background(img)
-            elif remove_bg and has_transparency(img):
-                show_info("Image already has transparency. Skipping background removal.", title="Background Removal")
-            save_image_with_transparency(img, output_path, format="WEBP", lossless=lossless, quality=quality)
-            original_size = os.path.getsize(input_path)
-            new_size = os.path.getsize(output_path)
-            show_success(
-                os.path.basename(input_path),
-                os.path.basename(output_path),
-                original_size,
-                new_size,
-                quality,
-            )
-            return True
+        result = convert_image_file(
+            input_path,
+            output_path,
+            quality=quality,
+            remove_bg=remove_bg,
+            lossless=lossless,
+            target=target,
+        )
+        if result["frames"] > 1:
+            show_info(f"Converted {result['frames']} frames to an animated WebP.", title="Animation")
+            if result["skipped_options"]:
+                ignored = ", ".join(name.replace("_", " ") for name in result["skipped_options"])
+                show_info(f"Not applied to animations: {ignored}.", title="Animation")
+        elif result["bg_skipped"]:
+            show_info("Image already has transparency. Skipping background removal.", title="Background Removal")
+        show_success(
+            os.path.basename(input_path),
+            os.path.basename(output_path),
+            result["original_size"],
+            result["new_size"],
+            result["quality"],
+        )
+        return True
     except Exception as e:
         show_error(str(e), title="Conversion Error")
         return False
@@ -178,32 +179,44 @@ def prompt_for_directory(default_dir):
     return out
 
 
-def _create_progress_bar(total_images):
-    return tqdm(
-        total=total_images,
-        unit="img",
-        desc="Converting",
-        bar_format="{desc}: {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]",
-    )
+def _counted(files_to_convert, counts):
+    """Yield jobs unchanged while counting them per action."""
+    for job in files_to_convert:
+        counts[job[2]] = counts.get(job[2], 0) + 1
+        yield job
+
+
+CUSTOM_STYLE_RULES = [
+    ("qmark", "fg:#00d7af bold"),
+    ("question", "bold"),
+    ("answer", "fg:#ffaf00 bold"),
+    ("pointer", "fg:#00d7af bold"),
+    ("highlighted", "fg:#00d7af bold"),
+    ("selected", "fg:#5f87ff bold"),
+    ("instruction", "fg:#888888 italic"),
+]
+
 
+@lru_cache(maxsize=None)
+def _custom_style():
+    # questionary is only imported once an interactive prompt is shown.
+    from questionary import Style
+    return Style(CUSTOM_STYLE_RULES)
 
-CUSTOM_STYLE = Style(
-    [
-        ("qmark", "fg:#00d7af bold"),
-        ("question", "bold"),
-        ("answer", "fg:#ffaf00 bold"),
-        ("pointer", "fg:#00d7af bold"),
-        ("highlighted", "fg:#00d7af bold"),
-        ("selected", "fg:#5f87ff bold"),
-        ("instruction", "fg:#888888 italic"),
-    ]
-)
 
 class WebPConverterCLI:
     def __init__(self):
-        self.console = Console()
+        self._console = None
+
+    @property
+    def console(self):
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
 
     def show_welcome(self):
+        from rich.panel import Panel
         self.console.print(f"[bold cyan]{RETRO_ASCII}[/bold cyan]")
         self.console.print(
             Panel.fit(
@@ -223,6 +236,7 @@ class WebPConverterCLI:
         )
 
     def main_menu(self):
+        import questionary
         while True:
             choice = questionary.select(
                 "What would you like to do?",
@@ -234,7 +248,7 @@ class WebPConverterCLI:
                 use_indicator=True,
                 instruction="(Use ↑/↓ arrows and Enter to select, Esc to exit)",
                 qmark="🔹",
-                style=CUSTOM_STYLE,
+                style=_custom_style(),
             ).ask()
 
             if choice is None or choice == "Exit":
@@ -255,28 +269,40 @@ class WebPConverterCLI:
         output_dir = self._get_output_dir(inputs)
         mode = self._get_operation_mode()
         quality, lossless, force, remove_bg = self._get_conversion_options(mode)
+        max_size = self._get_max_size() if mode == "Resize Only (retain original format)" else None
 
-        files_to_convert = self._get_files_to_convert(inputs, output_dir, mode)
-        if not files_to_convert:
+        # Scanning runs in the background; conversion starts with the first files found.
+        scan = ScanQueue(iter_jobs(inputs, output_dir))
+        files_to_convert = iter(scan)
+        head = list(islice(files_to_convert, 2))
+        if not head:
             self.console.print("[yellow]No images found to process.[/yellow]")
             return
 
-        self._process_files(files_to_convert, mode, quality, lossless, force, remove_bg)
+        workers = self._get_worker_count() if len(head) > 1 else 1
+        try:
+            self._process_files(
+                chain(head, files_to_convert), mode, quality, lossless, force, remove_bg, workers, max_size, scan
+            )
+        finally:
+            scan.close()
 
     def _get_input_path(self):
+        import questionary
         return questionary.path(
             "Enter input image file(s) or a folder path (comma-separated for multiple files):",
             qmark="🖼️ ",
-            style=CUSTOM_STYLE,
+            style=_custom_style(),
         ).ask()
 
     def _get_output_dir(self, inputs):
+        import questionary
         default_dir = get_downloads_dir()
         output_dir = questionary.path(
             f"Enter output directory for all files (default: {default_dir})",
             default=default_dir,
             qmark="📂 ",
-            style=CUSTOM_STYLE,
+            style=_custom_style(),
         ).ask()
         if not output_dir:
             output_dir = default_dir
@@ -285,6 +311,7 @@ class WebPConverterCLI:
         return output_dir
 
     def _get_operation_mode(self):
+        import questionary
         return questionary.select(
             "Choose operation mode:",
             choices=[
@@ -292,10 +319,11 @@ class WebPConverterCLI:
                 "Resize Only (retain original format)",
             ],
             qmark="🔧 ",
-            style=CUSTOM_STYLE,
+            style=_custom_style(),
         ).ask()
 
     def _get_conversion_options(self, mode):
+        import questionary
         quality = 80
         lossless = False
         if mode == "Convert to WebP":
@@ -304,18 +332,19 @@ class WebPConverterCLI:
                 choices=[
                     "Lossy (smaller files, recommended)",
                     "Lossless (may increase file size)",
+                    "Auto (per image: lossy for photos, lossless for logos and screenshots)",
                 ],
                 default="Lossy (smaller files, recommended)",
                 qmark="🗜️ ",
-                style=CUSTOM_STYLE,
+                style=_custom_style(),
             ).ask()
-            lossless = (lossless_choice.startswith("Lossless"))
+            lossless = AUTO if lossless_choice.startswith("Auto") else lossless_choice.startswith("Lossless")
             quality = questionary.text(
                 "WebP quality (0-100, default: 80):",
                 default="80",
                 validate=lambda val: val.isdigit() and 0 <= int(val) <= 100,
                 qmark="🎚️ ",
-                style=CUSTOM_STYLE,
+                style=_custom_style(),
             ).ask()
             quality = int(quality or 80)
 
@@ -323,7 +352,7 @@ class WebPConverterCLI:
             "Overwrite output file(s) without prompting?",
             default=False,
             qmark="⚠️ ",
-            style=CUSTOM_STYLE,
+            style=_custom_style(),
         ).ask()
 
         remove_bg = False
@@ -332,66 +361,99 @@ class WebPConverterCLI:
                 "Remove background from images? (uses AI)",
                 default=False,
                 qmark="🪄 ",
-                style=CUSTOM_STYLE,
+                style=_custom_style(),
             ).ask()
 
         return quality, lossless, force, remove_bg
 
+    def _get_max_size(self):
+        import questionary
+        max_size = questionary.text(
+            "Maximum width/height in pixels (leave blank to keep the original size):",
+            default="",
+            validate=lambda val: val == "" or (val.isdigit() and int(val) > 0),
+            qmark="📐 ",
+            style=_custom_style(),
+        ).ask()
+        return int(max_size) if max_size else None
+
+    def _get_worker_count(self):
+        import questionary
+        default_count = default_workers()
+        workers = questionary.text(
+            f"Parallel workers (default: {default_count}, 1 = sequential):",
+            default=str(default_count),
+            validate=lambda val: val.isdigit() and int(val) >= 1,
+            qmark="⚙️ ",
+            style=_custom_style(),
+        ).ask()
+        return int(workers or default_count)
+
     def _get_files_to_convert(self, inputs, output_dir, mode):
-        files_to_convert = []
-        for input_path in inputs:
-            if os.path.isdir(input_path):
-                for input_file, output_file, is_webp in self._get_image_files_from_dir(input_path, output_dir, input_path):
-                    if is_webp:
-                        files_to_convert.append((input_file, output_file, 'copy'))
-                    else:
-                        files_to_convert.append((input_file, output_file, 'convert'))
-            else:
-                file_lower = input_path.lower()
-                if file_lower.endswith('.webp'):
-                    rel_name = os.path.basename(input_path)
-                    output_file = os.path.join(output_dir, rel_name)
-                    files_to_convert.append((input_path, output_file, 'copy'))
-                else:
-                    rel_name = os.path.splitext(os.path.basename(input_path))[0] + '.webp'
-                    output_file = os.path.join(output_dir, rel_name)
-                    files_to_convert.append((input_path, output_file, 'convert'))
-        return files_to_convert
+        return list(iter_jobs(inputs, output_dir))
+
+    def _resolve_overwrites(self, files_to_convert):
+        """Ask about existing outputs up front so worker processes never prompt."""
+        resolved = []
+        for file_path, output_path, action in files_to_convert:
+            if action == 'convert' and os.path.exists(output_path):
+                if not ask_overwrite(os.path.basename(output_path)):
+                    show_info(f"Conversion skipped by user: {file_path}", title="Skipped")
+                    continue
+            resolved.append((file_path, output_path, action))
+        return resolved
 
-    def _process_files(self, files_to_convert, mode, quality, lossless, force, remove_bg):
+    def _process_files_batch(self, files_to_convert, mode, quality, lossless, remove_bg, workers, max_size=None, scan=None):
+        """
+        Run jobs through run_parallel behind a live dashboard (no per-file output)
+        and return a list of (file_path, error) tuples.
+        """
+        title = "Resizing" if mode == "Resize Only (retain original format)" else "Converting"
+        total = None if scan is not None else len(files_to_convert)
+        with BatchDashboard(total=total, scan=scan, title=title) as dashboard:
+            for result in run_parallel(
+                files_to_convert,
+                mode,
+                workers=workers,
+                quality=quality,
+                lossless=lossless,
+                remove_bg=remove_bg,
+                max_size=max_size,
+            ):
+                dashboard.record(result)
+        return dashboard.errors
+
+    def _process_files(self, files_to_convert, mode, quality, lossless, force, remove_bg, workers=1, max_size=None, scan=None):
+        """
+        Process jobs, showing panels for a single file or a live dashboard and summary
+        for several. files_to_convert may be a list, or a stream of jobs fed by scan.
+        """
         errors = []
-        from PIL import Image
+        from rich.panel import Panel
+        counts = {}
+        remaining = iter(files_to_convert)
+        head = list(islice(remaining, 2))
+        if len(head) < 2:
+            files_to_convert = head
+        elif scan is None:
+            files_to_convert = head + list(remaining)
+            for _, _, action in files_to_convert:
+                counts[action] = counts.get(action, 0) + 1
+        else:
+            files_to_convert = _counted(chain(head, remaining), counts)
         def resize_and_save(input_path, output_path):
             try:
-                with Image.open(input_path) as img:
-                    img = img.copy()
-                    img.save(output_path)
+                _resave(input_path, output_path, max_size=max_size)
                 return True
             except Exception as e:
                 return str(e)
 
         if mode == "Resize Only (retain original format)":
-            if len(files_to_convert) > 1:
-                with _create_progress_bar(len(files_to_convert)) as pbar:
-                    for file_path, output_path, action in files_to_convert:
-                        try:
-                            if action == 'copy':
-                                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                                shutil.copy2(file_path, output_path)
-                                self.console.print(
-                                    Panel.fit(
-                                        f"[yellow]Skipped (already WebP), copied to:[/yellow] {file_path} → {output_path}",
-                                        border_style="yellow",
-                                    )
-                                )
-                            else:
-                                result = resize_and_save(file_path, output_path)
-                                if result is not True:
-                                    errors.append((file_path, result))
-                        except Exception as e:
-                            errors.append((file_path, str(e)))
-                        pbar.update(1)
-                total = len(files_to_convert)
+            if len(head) > 1:
+                errors = self._process_files_batch(
+                    files_to_convert, mode, quality, lossless, remove_bg, workers, max_size, scan
+                )
+                total = sum(counts.values())
                 failed = len(errors)
                 succeeded = total - failed
                 if errors:
@@ -425,7 +487,7 @@ class WebPConverterCLI:
                 try:
                     if action == 'copy':
                         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                        shutil.copy2(file_path, output_path)
+                        place_file(file_path, output_path, LINK_MODES["auto"])
                         self.console.print(
                             Panel.fit(
                                 f"[yellow]Skipped (already WebP), copied to:[/yellow] {file_path} → {output_path}",
@@ -450,38 +512,21 @@ class WebPConverterCLI:
                         )
                     )
         else:
-            if len(files_to_convert) > 1:
-                with _create_progress_bar(len(files_to_convert)) as pbar:
-                    for file_path, output_path, action in files_to_convert:
-                        try:
-                            if action == 'copy':
-                                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                                shutil.copy2(file_path, output_path)
-                                self.console.print(
-                                    Panel.fit(
-                                        f"[yellow]Skipped (already WebP), copied to:[/yellow] {file_path} → {output_path}",
-                                        border_style="yellow",
-                                    )
-                                )
-                            else:
-                                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-                                convert_to_webp(
-                                    file_path,
-                                    output_path,
-                                    force=force,
-                                    quality=quality,
-                                    remove_bg=remove_bg,
-                                    lossless=lossless,
-                                )
-                        except Exception as e:
-                            errors.append((file_path, str(e)))
-                        pbar.update(1)
-                total = len(files_to_convert)
+            if len(head) > 1:
+                if force:
+                    errors = self._process_files_batch(
+                        files_to_convert, mode, quality, lossless, remove_bg, workers, scan=scan
+                    )
+                else:
+                    # Overwrite prompts need the full list before any file is processed.
+                    jobs = self._resolve_overwrites(list(files_to_convert))
+                    errors = self._process_files_batch(jobs, mode, quality, lossless, remove_bg, workers)
+                total = sum(counts.values())
                 failed = len(errors)
                 succeeded = total - failed
                 # Calculate counts for summary
-                converted_count = sum(1 for _, _, a in files_to_convert if a == 'convert')
-                copied_count = sum(1 for _, _, a in files_to_convert if a == 'copy')
+                converted_count = counts.get('convert', 0)
+                copied_count = counts.get('copy', 0)
                 if errors:
                     fail_list = "\n".join(f"{os.path.basename(f)}: {e}" for f, e in errors)
                     summary = (
@@ -498,9 +543,6 @@ class WebPConverterCLI:
                         )
                     )
                 else:
-                    # Calculate counts for summary
-                    converted_count = sum(1 for _, _, a in files_to_convert if a == 'convert')
-                    copied_count = sum(1 for _, _, a in files_to_convert if a == 'copy')
                     summary = (
                         f"[yellow]Processed:[/yellow] {total}\n"
                         f"[green]Successfully converted:[/green] {converted_count}\n"
@@ -517,7 +559,7 @@ class WebPConverterCLI:
                 file_path, output_path, action = files_to_convert[0]
                 try:
                     if action == 'copy':
-                        shutil.copy2(file_path, output_path)
+                        place_file(file_path, output_path, LINK_MODES["auto"])
                         self.console.print(
                             Panel.fit(
                                 f"[green]Copied:[/green] {file_path} → {output_path}",
@@ -560,44 +602,22 @@ class WebPConverterCLI:
         """
         if input_root is None:
             input_root = directory
-        for root, _, files in os.walk(directory):
-            for file in files:
-                file_lower = file.lower()
-                if not file_lower.endswith(tuple(Image.registered_extensions().keys())):
-                    continue
-                input_file = os.path.join(root, file)
-                if output_dir:
-                    rel_path = os.path.relpath(input_file, input_root)
-                    if file_lower.endswith('.webp'):
-                        output_file = os.path.join(output_dir, rel_path)
-                        yield (input_file, output_file, True)
-                    else:
-                        rel_path = os.path.splitext(rel_path)[0] + '.webp'
-                        output_file = os.path.join(output_dir, rel_path)
-                        yield (input_file, output_file, False)
-                else:
-                    yield (input_file, None, file_lower.endswith('.webp'))
+        for input_file in scan_images(directory):
+            if output_dir:
+                output_file, action = output_path_for(input_file, output_dir, input_root)
+                yield (input_file, output_file, action == 'copy')
+            else:
+                yield (input_file, None, input_file.lower().endswith('.webp'))
 
     def _get_image_files(self, inputs, output_dir):
         """
         Yield (input_file, output_file, is_webp) for all files in inputs, preserving structure.
         """
-        for input_path in inputs:
-            if os.path.isdir(input_path):
-                for input_file, output_file, is_webp in self._get_image_files_from_dir(input_path, output_dir, input_path):
-                    yield (input_file, output_file, is_webp)
-            else:
-                file_lower = input_path.lower()
-                if file_lower.endswith('.webp'):
-                    rel_name = os.path.basename(input_path)
-                    output_file = os.path.join(output_dir, rel_name)
-                    yield (input_path, output_file, True)
-                else:
-                    rel_name = os.path.splitext(os.path.basename(input_path))[0] + '.webp'
-                    output_file = os.path.join(output_dir, rel_name)
-                    yield (input_path, output_file, False)
+        for input_file, output_file, action in iter_jobs(inputs, output_dir):
+            yield (input_file, output_file, action == 'copy')
 
     def show_info(self):
+        from rich.panel import Panel
         self.console.print(
             Panel.fit(
                 "A command-line tool to convert images to WebP format.\n\n"
@@ -613,7 +633,17 @@ class WebPConverterCLI:
         )
 
 
-def main():
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "batch":
+        from .batch import main as batch_main
+        sys.exit(batch_main(argv[1:]))
+    if argv and argv[0] == "serve":
+        from .serve import main as serve_main
+        sys.exit(serve_main(argv[1:]))
+    if argv and argv[0] == "watch":
+        from .watch import main as watch_main
+        sys.exit(watch_main(argv[1:]))
     cli = WebPConverterCLI()
     cli.show_welcome()
     cli.main_menu()
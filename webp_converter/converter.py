@@ -0,0 +1,219 @@
+"""
+converter.py
+In-memory conversion API for embedding: bytes, file objects or PIL images in,
+WebP bytes and a result record out, with no disk or terminal I/O.
+"""
+import io
+import time
+from collections import deque
+from PIL import Image, UnidentifiedImageError
+from .animation import is_animated
+from .budget import check_dimensions
+from .classify import AUTO, compression_record, resolve_encoding
+from .image_utils import has_transparency, prepare_for_webp, shrink_on_load
+from .timing import count, stage, track
+
+
+class Converter:
+    """
+    Reusable WebP converter. Holds the conversion options and, with remove_bg, a warm
+    rembg session, so repeated calls only pay for the conversion itself. One instance
+    can be shared between threads.
+
+    Example:
+        converter = Converter(quality=75, max_size=1600)
+        data, record = converter.convert(upload_bytes)
+    """
+
+    def __init__(
+        self,
+        quality=80,
+        lossless=False,
+        remove_bg=False,
+        bg_model=None,
+        max_size=None,
+        target=None,
+        animation=None,
+        max_pixels=None,
+        warm=True,
+    ):
+        """
+        Args:
+            quality (int): WebP quality (0-100).
+            lossless (bool or str): If True, use lossless WebP; 'auto' picks lossy,
+                near-lossless or lossless per image (see classify.choose_encoding).
+            remove_bg (bool): If True, remove backgrounds of images that are not already transparent.
+            bg_model (str): rembg model used for background removal (None for the default).
+            max_size (int): Scale still images down to fit within max_size x max_size pixels.
+            target (autotune.QualityTarget): Pick the quality automatically to hit a byte
+                size or SSIM/PSNR target (lossy only; no quality cache is read or written).
+            animation (dict): Encoder options for animated inputs (see animation.ANIMATION_OPTIONS).
+            max_pixels (int): Reject images with more pixels than this (see budget.check_dimensions).
+            warm (bool): With remove_bg, load the model now rather than on the first call.
+        """
+        if not 0 <= quality <= 100:
+            raise ValueError("quality must be between 0 and 100")
+        self.quality = quality
+        self.lossless = lossless
+        self.remove_bg = remove_bg
+        self.bg_model = bg_model
+        self.max_size = max_size
+        self.target = target
+        self.animation = animation or {}
+        self.max_pixels = max_pixels
+        if remove_bg and warm:
+            self.warm_up()
+
+    def warm_up(self):
+        """Load the rembg session and run one tiny inference (only with remove_bg)."""
+        if self.remove_bg:
+            from .bg_removal import warm_up
+            warm_up(self.bg_model)
+
+    def convert(self, source, name=None):
+        """
+        Convert one image to WebP in memory.
+        Args:
+            source: Encoded image bytes, a binary file-like object or a PIL image.
+            name (str): Optional label for the record (e.g. the upload's file name).
+        Returns:
+            (bytes, dict): The WebP data and a result record with name, original_size
+            (None for PIL images), new_size, width, height, frames, quality, mode
+            ('lossy', 'near-lossless', 'lossless' or 'mixed' for animations in auto mode;
+            in auto mode also method, classification and, for lossless modes, effort
+            instead of quality), bg_skipped, for animations skipped_options (the ones
+            of remove_bg, max_size and target that were set but do not apply), timings
+            (seconds per stage) and duration.
+        Raises:
+            Exception: Any error raised while decoding, processing or encoding.
+        """
+        start = time.perf_counter()
+        with track(name) as trace:
+            data, record = self._convert(source)
+        timings = {}
+        for item in trace.stages:
+            timings[item["stage"]] = timings.get(item["stage"], 0) + item["dur"]
+        record.update(name=name, timings=timings, duration=time.perf_counter() - start)
+        return data, record
+
+    def convert_many(self, sources, workers=1):
+        """
+        Convert several images, yielding (data, record) pairs in input order. Errors do
+        not stop the iteration: the failed item yields (None, record) with record['error']
+        set (None on success). sources may be any iterable, including a generator.
+        Args:
+            sources (iterable): Items accepted by convert(), or (name, source) tuples.
+            workers (int): Threads to convert on; Pillow's codecs and onnxruntime release
+                the GIL, so a few threads overlap well. At most 2 x workers items are in flight.
+        """
+        if workers <= 1:
+            for item in sources:
+                yield self._convert_safely(item)
+            return
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for item in sources:
+                pending.append(pool.submit(self._convert_safely, item))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _convert_safely(self, item):
+        name, source = item if isinstance(item, tuple) else (None, item)
+        try:
+            data, record = self.convert(source, name=name)
+        except Exception as e:
+            return None, {"name": name, "error": str(e)}
+        record["error"] = None
+        return data, record
+
+    def _open(self, source):
+        """Return (image, original bytes or None, whether we opened the image)."""
+        if isinstance(source, Image.Image):
+            return source, None, False
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            data = bytes(source)
+        elif hasattr(source, "read"):
+            data = source.read()
+        else:
+            raise TypeError(f"Expected bytes, a file-like object or a PIL image, not {type(source).__name__}")
+        try:
+            return Image.open(io.BytesIO(data)), data, True
+        except UnidentifiedImageError:
+            raise ValueError("Not a supported image format.")
+
+    def _convert(self, source):
+        source_img, original, opened = self._open(source)
+        img = source_img
+        try:
+            check_dimensions(img.width, img.height, self.max_pixels)
+            frames = img.n_frames if is_animated(img) else 1
+            count(bytes_in=len(original) if original is not None else 0, pixels=img.width * img.height * frames)
+            if frames > 1:
+                from .animation import encode_animated_webp
+                data = encode_animated_webp(img, quality=self.quality, lossless=self.lossless, **self.animation)
+                record = self._record(original, data, img.size, frames, self.quality, False)
+                record["skipped_options"] = [
+                    name for name in ("remove_bg", "max_size", "target") if getattr(self, name)
+                ]
+                if self.lossless == AUTO:
+                    record["mode"] = "mixed"
+                return data, record
+            img, bg_skipped = self._prepare(img, opened)
+            with stage("prepare"):
+                img = prepare_for_webp(img)
+            quality, lossless, options, decision = self.quality, self.lossless, {}, None
+            if lossless == AUTO:
+                with stage("classify"):
+                    img, options, decision = resolve_encoding(img, quality)
+                lossless, quality = options.pop("lossless"), options.pop("quality")
+            if self.target is not None and not lossless:
+                from .autotune import search_quality
+                with stage("autotune"):
+                    quality, data = search_quality(img, self.target, **options)
+            else:
+                from .autotune import encode_webp
+                with stage("encode"):
+                    data = encode_webp(img, quality, lossless, **options)
+            record = self._record(original, data, img.size, 1, quality, bg_skipped)
+            record.update(compression_record(lossless, decision))
+            return data, record
+        finally:
+            if opened:
+                source_img.close()
+
+    def _prepare(self, img, opened):
+        """Decode (at reduced scale where possible), resize and remove the background."""
+        if self.max_size and max(img.size) > self.max_size:
+            scale = self.max_size / max(img.size)
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            with stage("decode"):
+                if opened:
+                    img = shrink_on_load(img, size)
+                img.load()
+            with stage("resize"):
+                img = img.resize(size, Image.Resampling.LANCZOS)
+        else:
+            with stage("decode"):
+                img.load()
+        if not self.remove_bg:
+            return img, False
+        if has_transparency(img):
+            return img, True
+        from .bg_removal import remove_background
+        return remove_background(img if img.mode == "RGBA" else img.convert("RGBA"), model_name=self.bg_model), False
+
+    def _record(self, original, data, size, frames, quality, bg_skipped):
+        count(bytes_out=len(data))
+        return {
+            "original_size": len(original) if original is not None else None,
+            "new_size": len(data),
+            "width": size[0],
+            "height": size[1],
+            "frames": frames,
+            "quality": quality,
+            "mode": "lossless" if self.lossless is True else "lossy",
+            "bg_skipped": bg_skipped,
+        }
@@ -0,0 +1,104 @@
+"""
+dashboard.py
+Aggregated live progress for multi-file runs: results are tallied in memory and a
+single rich Live view is redrawn at a fixed rate, however fast files complete.
+"""
+import os
+import time
+
+
+def format_bytes(size_bytes):
+    """Format a byte count as B/KB/MB/GB."""
+    for unit in ("B", "KB", "MB"):
+        if abs(size_bytes) < 1024:
+            return f"{size_bytes:.0f} {unit}" if unit == "B" else f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024
+    return f"{size_bytes:.2f} GB"
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+
+class BatchDashboard:
+    """
+    Live batch progress: done/total, img/s, MB/s (input), bytes saved, errors and ETA.
+    Use as a context manager and call record(result) for every result record
+    (see parallel.process_file). With a scanner.ScanQueue, the total follows the scan.
+    """
+
+    def __init__(self, total=None, scan=None, title="Converting", refresh_per_second=4):
+        self.total = total
+        self.scan = scan
+        self.title = title
+        self.refresh_per_second = refresh_per_second
+        self.done = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = []
+        self._start = None
+        self._live = None
+
+    def record(self, result):
+        """Add one result record; cheap enough to call for every file."""
+        self.done += 1
+        if result["error"] is not None:
+            self.failed += 1
+            self.errors.append((result["input"], result["error"]))
+            return
+        original_size = result.get("original_size")
+        if original_size is None:
+            try:
+                original_size = os.path.getsize(result["input"])
+            except OSError:
+                original_size = 0
+        self.bytes_in += original_size
+        self.bytes_out += result.get("new_size", original_size)
+
+    def _expected(self):
+        if self.scan is not None:
+            return self.scan.found, self.scan.done
+        return self.total, self.total is not None
+
+    def __rich__(self):
+        from rich.progress_bar import ProgressBar
+        from rich.table import Table
+        elapsed = max(time.perf_counter() - self._start, 1e-9)
+        expected, final = self._expected()
+        rate = self.done / elapsed
+        saved = self.bytes_in - self.bytes_out
+        saved_percent = saved / self.bytes_in * 100 if self.bytes_in else 0
+        if expected and final and rate:
+            eta = _format_duration(max(expected - self.done, 0) / rate)
+        else:
+            eta = "--:--"
+        count = f"{self.done}/{expected if expected is not None else '?'}{'' if final else '+'}"
+
+        grid = Table.grid(padding=(0, 2))
+        grid.add_column(style="cyan")
+        grid.add_column()
+        grid.add_row(
+            self.title,
+            ProgressBar(total=max(expected or 0, self.done, 1), completed=self.done, width=40),
+        )
+        grid.add_row("Files", f"{count}   [red]{self.failed} failed[/red]" if self.failed else count)
+        grid.add_row("Throughput", f"{rate:.1f} img/s   {self.bytes_in / elapsed / (1024 * 1024):.2f} MB/s")
+        grid.add_row("Saved", f"[green]{format_bytes(saved)}[/green] ({saved_percent:.1f}%)")
+        grid.add_row("Elapsed / ETA", f"{_format_duration(elapsed)} / {eta}")
+        return grid
+
+    def __enter__(self):
+        from rich.live import Live
+        from .ui_helpers import get_console
+        self._start = time.perf_counter()
+        self._live = Live(self, console=get_console(), refresh_per_second=self.refresh_per_second)
+        self._live.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._live.stop()
+        if not self._live.console.is_terminal:
+            self._live.console.line()  # Live leaves the final frame unterminated when redirected
@@ -0,0 +1,207 @@
+"""
+dedup.py
+Content deduplication for batches: byte-identical inputs converted with the same
+parameters are encoded once, and every other output is linked to that result.
+A persistent hash -> output index lets later batches reuse earlier outputs.
+"""
+import os
+import sys
+import json
+from .autotune import default_cache_path
+from .links import LINK_MODES, place_file
+from .manifest import file_hash
+
+
+def default_index_path():
+    return os.path.join(os.path.dirname(default_cache_path()), "dedup-index.jsonl")
+
+
+class DedupIndex:
+    """
+    Append-only JSON-lines index of content key -> output file. An entry is only
+    reused while its output still has the size and mtime recorded for it.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        self.entries = {}
+        self.input_sizes = set()
+        self.write_error = None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+                        self.input_sizes.add(entry["input_size"])
+                    except (ValueError, KeyError):
+                        continue
+        except OSError:
+            pass
+
+    def lookup(self, key):
+        """Return the output recorded for key if it is still intact, else None."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        try:
+            st = os.stat(entry["output"])
+        except OSError:
+            return None
+        if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]:
+            return None
+        return entry["output"]
+
+    def add(self, key, input_size, output_path):
+        try:
+            st = os.stat(output_path)
+        except OSError:
+            return
+        entry = {
+            "key": key,
+            "input_size": input_size,
+            "output": os.path.abspath(output_path),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
+        self.entries[key] = entry
+        self.input_sizes.add(input_size)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # One short line per O_APPEND write, so concurrent batches do not interleave.
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            # The batch itself is fine; only later batches lose the reuse. Say so once.
+            if self.write_error is None:
+                print(f"Cannot update dedup index {self.path}: {e}", file=sys.stderr)
+            self.write_error = e
+
+
+class _Original:
+    """An input that is (or was) converted itself; duplicates wait on it."""
+
+    __slots__ = ("input", "output", "size", "key", "state", "error", "waiting")
+
+    def __init__(self, input_path, output_path, size, state="pending"):
+        self.input = input_path
+        self.output = output_path
+        self.size = size
+        self.key = None
+        self.state = state  # 'pending', 'done' or 'failed'
+        self.error = None
+        self.waiting = []
+
+
+class Deduplicator:
+    """
+    Sits between job discovery and conversion. Inputs are only hashed when another
+    input (or an index entry) has the same size. Call filter() on the job stream and
+    finish() with every result record. Duplicates are placed with methods (see
+    links.LINK_MODES); hardlinks are opt-in, since linked outputs share edits.
+    """
+
+    def __init__(self, params, index=None, methods=LINK_MODES["auto"]):
+        self.params_key = json.dumps(params, sort_keys=True)
+        self.index = index
+        self.methods = methods
+        self._first_by_size = {}  # size -> first _Original of that size, not hashed yet
+        self._hashed_sizes = set()
+        self._by_key = {}
+        self._in_flight = {}  # output path -> _Original being converted
+
+    def _key(self, input_path):
+        return f"{file_hash(input_path)}:{self.params_key}"
+
+    def _register(self, original, key):
+        original.key = key
+        self._by_key[key] = original
+
+    def filter(self, jobs, emit):
+        """
+        Yield the jobs that need converting. Duplicates are placed once their original
+        is ready (immediately for index hits) and reported through emit(record).
+        """
+        for job in jobs:
+            input_path, output_path, action = job
+            try:
+                size = os.path.getsize(input_path) if action == "convert" else None
+            except OSError:
+                size = None
+            if size is None:
+                yield job
+                continue
+            original = _Original(input_path, output_path, size)
+            known_size = (
+                size in self._hashed_sizes
+                or size in self._first_by_size
+                or (self.index is not None and size in self.index.input_sizes)
+            )
+            if not known_size:
+                self._first_by_size[size] = original
+                self._in_flight[output_path] = original
+                yield job
+                continue
+            first = self._first_by_size.pop(size, None)
+            self._hashed_sizes.add(size)
+            if first is not None:
+                self._register(first, first.key or self._key(first.input))
+            key = self._key(input_path)
+            match = self._by_key.get(key)
+            if match is None and self.index is not None:
+                source = self.index.lookup(key)
+                if source is not None:
+                    match = _Original(None, source, size, state="done")
+                    match.key = key
+                    self._by_key[key] = match
+            if match is None:
+                self._register(original, key)
+                self._in_flight[output_path] = original
+                yield job
+            elif match.state == "pending":
+                match.waiting.append((input_path, output_path))
+            else:
+                emit(self._place(match, input_path, output_path))
+
+    def _place(self, original, input_path, output_path):
+        record = {
+            "input": input_path,
+            "output": output_path,
+            "action": "convert",
+            "source": original.output,
+        }
+        if original.state == "failed":
+            return dict(record, status="error", error=f"Duplicate of {original.input}, which failed: {original.error}")
+        try:
+            method = place_file(original.output, output_path, self.methods)
+        except OSError as e:
+            return dict(record, status="error", error=str(e))
+        return dict(
+            record,
+            status="deduplicated",
+            error=None,
+            link=method,
+            original_size=original.size,
+            new_size=os.path.getsize(output_path),
+        )
+
+    def finish(self, result):
+        """
+        Take a finished result record; return records for the duplicates that were
+        waiting on it.
+        """
+        original = self._in_flight.pop(result["output"], None)
+        if original is None:
+            return []
+        if result["error"] is None:
+            original.state = "done"
+            if self.index is not None:
+                if original.key is None:
+                    # Hash after the fact so later batches can reuse this output.
+                    original.key = self._key(original.input)
+                self.index.add(original.key, original.size, original.output)
+        else:
+            original.state = "failed"
+            original.error = result["error"]
+        waiting, original.waiting = original.waiting, []
+        return [self._place(original, input_path, output_path) for input_path, output_path in waiting]
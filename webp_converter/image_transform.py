@@ -5,7 +5,8 @@ Robust logo/image transformation utilities for consistent sizing and padding.
 import os
 import logging
 from PIL import Image, UnidentifiedImageError
-from .image_utils import save_image_with_transparency
+from .image_utils import save_image_with_transparency, shrink_on_load
+from .timing import count, stage
 
 
 def transform_logo(image_path, output_dir, target_size=300, padding=10):
@@ -21,7 +22,6 @@ def transform_logo(image_path, output_dir, target_size=300, padding=10):
     """
     try:
         with Image.open(image_path) as img:
-            img = img.convert("RGBA")
             original_width, original_height = img.size
             if original_width == 0 or original_height == 0:
                 logging.warning(
@@ -31,7 +31,11 @@ def transform_logo(image_path, output_dir, target_size=300, padding=10):
             scale = min(target_size / original_width, target_size / original_height)
             new_width = int(original_width * scale)
             new_height = int(original_height * scale)
-            resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            count(pixels=original_width * original_height, bytes_in=os.path.getsize(image_path))
+            with stage("decode"):
+                img = shrink_on_load(img, (new_width, new_height), mode="RGBA")
+            with stage("resize"):
+                resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
             padded_width = target_size + (2 * padding)
             padded_height = target_size + (2 * padding)
             new_img = Image.new("RGBA", (padded_width, padded_height), (0, 0, 0, 0))
@@ -42,6 +46,7 @@ def transform_logo(image_path, output_dir, target_size=300, padding=10):
             output_filename = os.path.splitext(base_name)[0] + ".png"
             output_path = os.path.join(output_dir, output_filename)
             save_image_with_transparency(new_img, output_path, format="PNG")
+            count(bytes_out=os.path.getsize(output_path))
             logging.info(f"Transformed and saved: {output_path}")
             return output_path
     except FileNotFoundError:
@@ -2,21 +2,203 @@
 image_utils.py
 Shared utilities for image conversion and saving with transparency (DRY principle).
 """
+import io
+import os
 from PIL import Image
+from .animation import is_animated
+from .classify import AUTO, compression_record, resolve_encoding
+from .timing import count, stage
+from .writer import write_output
 
-def save_image_with_transparency(img, output_path, format="PNG", lossless=False, **kwargs):
+# Modes that carry an alpha channel; palette/L/RGB images may also declare a
+# transparent colour through info["transparency"].
+ALPHA_MODES = ("RGBA", "LA", "PA", "RGBa", "La")
+
+
+def may_have_alpha(image):
+    """Return True if the image's mode or format metadata declares transparency (no pixel scan)."""
+    return image.mode in ALPHA_MODES or "transparency" in image.info
+
+
+def has_transparency(image):
+    """Return True if the image has at least one non-opaque pixel."""
+    if not may_have_alpha(image):
+        return False
+    if image.mode not in ("RGBA", "LA"):
+        image = image.convert("RGBA")
+    return image.getchannel("A").getextrema()[0] < 255
+
+
+def prepare_for_webp(image):
+    """
+    Return the image in the cheapest mode the WebP encoder accepts without losing data.
+    Opaque images stay RGB (or L, which the encoder expands itself); RGBA is only
+    used when the image really has transparent pixels.
+    """
+    if may_have_alpha(image):
+        if has_transparency(image):
+            return image if image.mode == "RGBA" else image.convert("RGBA")
+        return image.convert("RGB")
+    if image.mode in ("RGB", "L"):
+        return image
+    return image.convert("RGB")
+
+
+def shrink_on_load(img, size, mode=None, reducing_gap=2.0):
     """
-    Convert image to RGBA and save as PNG or WebP (preserves transparency).
+    Cut decode work for an image that is about to be resized down to `size`.
+    JPEGs are decoded directly at the smallest DCT scale (1/2, 1/4 or 1/8) that stays at
+    least `reducing_gap` times larger than the target; other formats are shrunk by an
+    integer factor with Image.reduce. The caller still does the final high-quality resample.
+    Args:
+        img (PIL.Image.Image): Freshly opened image (not yet loaded, so JPEG scaling can apply).
+        size (tuple): Target (width, height) of the final resize.
+        mode (str): Optional mode to convert to before reducing (e.g. 'RGBA').
+        reducing_gap (float): How much larger than the target the shrunk image must stay.
+    Returns:
+        PIL.Image.Image: The (possibly smaller) image to resample from.
+    """
+    width, height = size
+    min_size = (max(1, int(width * reducing_gap)), max(1, int(height * reducing_gap)))
+    if img.format == "JPEG":
+        img.draft(None, min_size)
+    if mode and img.mode != mode:
+        img = img.convert(mode)
+    factor = min(img.width // min_size[0], img.height // min_size[1])
+    if factor >= 2 and img.mode not in ("1", "P", "I;16"):
+        img = img.reduce(factor)
+    return img
+
+
+def save_image_with_transparency(img, output_path, format="PNG", lossless=False, writer=None, **kwargs):
+    """
+    Save an image as PNG or WebP, preserving transparency.
+    For WebP the image is first reduced to the cheapest compatible mode (see prepare_for_webp);
+    PNG stores every mode natively, so it is saved as-is. With lossless='auto' the WebP
+    encoding is chosen per image (see classify.choose_encoding).
+    The image is encoded in memory and written atomically (see writer.write_output).
     Args:
         img (PIL.Image.Image): Image to save.
         output_path (str): Path to save the image.
         format (str): 'PNG' or 'WEBP'.
-        lossless (bool): If True, use lossless WebP. Default False (lossy, smaller).
+        lossless (bool or str): If True, use lossless WebP; 'auto' picks lossy, near-lossless
+            or lossless from the image content. Default False (lossy, smaller).
+        writer (writer.PendingWrites): Write in the background instead of on this thread.
         kwargs: Additional arguments for PIL save.
+    Returns:
+        int: Size of the encoded file in bytes.
     """
-    img = img.convert("RGBA")
-    if format.upper() == "WEBP":
-        img.save(output_path, "WEBP", lossless=lossless, **kwargs)
-    else:
-        img.save(output_path, "PNG", **kwargs)
+    with io.BytesIO() as buf:
+        if format.upper() == "WEBP":
+            with stage("prepare"):
+                img = prepare_for_webp(img)
+            if lossless == AUTO:
+                with stage("classify"):
+                    img, options, _ = resolve_encoding(img, kwargs.get("quality", 80))
+                lossless = options.pop("lossless")
+                kwargs.update(options)
+            with stage("encode"):
+                img.save(buf, "WEBP", lossless=lossless, **kwargs)
+        else:
+            with stage("encode"):
+                img.save(buf, "PNG", **kwargs)
+        data = buf.getvalue()
+    write_output(output_path, data, writer)
+    return len(data)
 
+
+def convert_image_file(
+    input_path,
+    output_path,
+    quality=80,
+    remove_bg=False,
+    lossless=False,
+    bg_model=None,
+    target=None,
+    writer=None,
+    animation=None,
+):
+    """
+    Convert a single image file to WebP without any user interaction.
+    Animated inputs (GIF, APNG, ...) become animated WebPs; background removal and
+    quality targets apply to still images only.
+    Args:
+        input_path (str): Path to the input image.
+        output_path (str): Path to save the WebP image.
+        quality (int): WebP quality (0-100). Ignored for lossy output when target is set.
+        remove_bg (bool): If True, remove the background unless the image is already transparent.
+        lossless (bool or str): If True, use lossless WebP; 'auto' chooses per image
+            (see classify.choose_encoding).
+        bg_model (str): rembg model used for background removal (None for the default).
+        target (autotune.QualityTarget): If set (and the image is encoded lossy), pick the
+            quality automatically to hit a byte size or SSIM/PSNR target.
+        writer (writer.PendingWrites): Write the output in the background; the caller
+            must wait for it before relying on the file.
+        animation (dict): Encoder options for animated inputs (see animation.ANIMATION_OPTIONS).
+    Returns:
+        dict: original_size, new_size, quality (the one used), bg_skipped
+        (True if background removal was skipped because the image is transparent),
+        frames (1 for still images), for animations skipped_options (the ones of
+        remove_bg and target that were given but do not apply) and mode
+        ('lossy', 'near-lossless', 'lossless' or, for animations in auto mode, 'mixed');
+        in auto mode also method, classification and, for lossless modes, effort in
+        place of quality (see classify.compression_record).
+    Raises:
+        Exception: Any error raised while reading, processing or saving the image.
+    """
+    bg_skipped = False
+    with Image.open(input_path) as img:
+        if is_animated(img):
+            from .animation import encode_animated_webp
+            frames = img.n_frames
+            count(pixels=img.width * img.height * frames)
+            data = encode_animated_webp(img, quality=quality, lossless=lossless, **(animation or {}))
+            write_output(output_path, data, writer)
+            original_size = os.path.getsize(input_path)
+            count(bytes_in=original_size, bytes_out=len(data))
+            return {
+                "original_size": original_size,
+                "new_size": len(data),
+                "quality": quality,
+                "bg_skipped": False,
+                "skipped_options": [name for name, value in (("remove_bg", remove_bg), ("target", target)) if value],
+                "frames": frames,
+                "mode": "mixed" if lossless == AUTO else compression_record(lossless)["mode"],
+            }
+        with stage("decode"):
+            img.load()
+        count(pixels=img.width * img.height)
+        if remove_bg and has_transparency(img):
+            bg_skipped = True
+        elif remove_bg:
+            from .bg_removal import remove_background
+            img = remove_background(img if img.mode == "RGBA" else img.convert("RGBA"), model_name=bg_model)
+        decision = None
+        options = {}
+        if lossless == AUTO:
+            with stage("classify"):
+                img, options, decision = resolve_encoding(prepare_for_webp(img), quality)
+            lossless = options.pop("lossless")
+            quality = options.pop("quality")
+        if target is not None and not lossless:
+            from .autotune import tune_quality
+            from .manifest import file_hash
+            content_key = file_hash(input_path) + (f":bg={bg_model}" if remove_bg and not bg_skipped else "")
+            with stage("autotune"):
+                quality, data, _ = tune_quality(prepare_for_webp(img), content_key, target, **options)
+            write_output(output_path, data, writer)
+            new_size = len(data)
+        else:
+            new_size = save_image_with_transparency(
+                img, output_path, format="WEBP", lossless=lossless, writer=writer, quality=quality, **options
+            )
+    original_size = os.path.getsize(input_path)
+    count(bytes_in=original_size, bytes_out=new_size)
+    return {
+        "original_size": original_size,
+        "new_size": new_size,
+        "quality": quality,
+        "bg_skipped": bg_skipped,
+        "frames": 1,
+        **compression_record(lossless, decision),
+    }
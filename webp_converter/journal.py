@@ -0,0 +1,175 @@
+"""
+journal.py
+Crash-safe batch journal: an append-only JSON-lines log of every job's planned,
+started and completed states, synced to disk in groups, from which an interrupted
+batch can be resumed without re-planning it.
+"""
+import os
+import json
+import time
+from .manifest import file_hash
+
+JOURNAL_VERSION = 1
+# Statuses whose output is a finished file worth checking on resume.
+OUTPUT_STATUSES = ("converted", "copied", "deduplicated")
+
+
+class BatchJournal:
+    """
+    Appends journal lines and fsyncs them every sync_every lines or sync_interval
+    seconds, whichever comes first. A crash loses at most the last unsynced group,
+    and those jobs are simply redone on resume.
+    A new journal (resume=False) replaces any file at path; with resume=True the
+    existing journal is appended to.
+    """
+
+    def __init__(self, path, argv=None, resume=False, sync_every=256, sync_interval=1.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        torn = False
+        if resume and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        if resume:
+            if torn:
+                self._file.write("\n")  # end a line cut off by the crash
+        else:
+            # argv may hold relative paths; resume runs from the same directory.
+            self._append({"state": "batch", "version": JOURNAL_VERSION, "argv": argv, "cwd": os.getcwd()})
+            self.sync()
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def plan(self, jobs):
+        """Record each job as planned as it passes through; mark the plan complete at the end."""
+        for input_path, output_path, action in jobs:
+            self._append({"state": "planned", "input": input_path, "output": output_path, "action": action})
+            yield (input_path, output_path, action)
+        self._append({"state": "plan_done"})
+
+    def start(self, jobs):
+        """Record each job as started as it is handed to the workers."""
+        for job in jobs:
+            self._append({"state": "started", "output": job[1]})
+            yield job
+
+    def completed(self, record):
+        """Record a finished result record (any status) with its output's size and checksum."""
+        if record.get("output") is None:
+            return
+        entry = {"state": "completed", "output": record["output"], "status": record["status"]}
+        for key in ("original_size", "new_size"):
+            if key in record:
+                entry[key] = record[key]
+        if record["status"] in OUTPUT_STATUSES:
+            try:
+                entry["size"] = os.path.getsize(record["output"])
+                entry["checksum"] = file_hash(record["output"])
+            except OSError:
+                pass
+        self._append(entry)
+
+    def finished(self, totals):
+        self._append({"state": "finished", "totals": totals})
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+
+class JournalState:
+    """
+    What a journal says about a batch: the command line it was started with, which
+    jobs are still to do and the results of the completed ones.
+    """
+
+    def __init__(self):
+        self.argv = None
+        self.cwd = None  # working directory the batch was started in (None in old journals)
+        self.planned = {}  # output -> (input, output, action)
+        self.started = set()
+        self.completed = {}  # output -> completed entry
+        self.plan_done = False
+
+    def known(self, output_path):
+        return output_path in self.planned or output_path in self.completed
+
+    def verify(self):
+        """
+        Forget completions whose output is missing or no longer has the recorded size
+        and checksum (e.g. lost or torn in a power cut), so those jobs are redone.
+        Returns how many were dropped.
+        """
+        dropped = 0
+        for output_path, entry in list(self.completed.items()):
+            if "size" not in entry:
+                continue
+            try:
+                intact = os.path.getsize(output_path) == entry["size"]
+                if intact and "checksum" in entry:
+                    intact = file_hash(output_path) == entry["checksum"]
+            except OSError:
+                intact = False
+            if not intact and output_path in self.planned:
+                del self.completed[output_path]
+                dropped += 1
+        return dropped
+
+    def pending_jobs(self):
+        """Yield planned jobs without a completion, in plan order."""
+        for output_path, job in self.planned.items():
+            if output_path not in self.completed:
+                yield job
+
+    def interrupted(self):
+        """Outputs of jobs that were started but never completed."""
+        return [o for o in self.started if o not in self.completed and o in self.planned]
+
+
+def load_journal(path):
+    """
+    Read a journal into a JournalState. Unreadable lines (such as one torn by a
+    crash) are skipped.
+    Raises:
+        OSError: If the journal cannot be read.
+        ValueError: If it is not a batch journal.
+    """
+    state = JournalState()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                kind = entry["state"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if kind == "batch":
+                if entry.get("version") != JOURNAL_VERSION:
+                    raise ValueError(f"unsupported journal version {entry.get('version')}")
+                state.argv = entry.get("argv") or []
+                state.cwd = entry.get("cwd")
+            elif kind == "planned":
+                state.planned[entry["output"]] = (entry["input"], entry["output"], entry["action"])
+            elif kind == "started":
+                state.started.add(entry["output"])
+            elif kind == "completed":
+                state.completed[entry["output"]] = entry
+            elif kind == "plan_done":
+                state.plan_done = True
+    if state.argv is None:
+        raise ValueError("not a batch journal")
+    return state
@@ -0,0 +1,90 @@
+"""
+links.py
+Place an existing file at another path without re-encoding it: hardlink, reflink
+(copy-on-write clone) or plain copy, whichever works first.
+"""
+import os
+import shutil
+from .writer import temp_path
+
+LINK_METHODS = ("hardlink", "reflink", "copy")
+# User-facing modes for placing existing files. Hardlinks share the inode with the
+# source, so they are opt-in; reflinks are copy-on-write and safe by default.
+LINK_MODES = {
+    "auto": ("reflink", "copy"),
+    "hardlink": ("hardlink", "reflink", "copy"),
+    "copy": ("copy",),
+}
+# Linux ioctl that clones a file's extents (btrfs, XFS, bcachefs, ...).
+FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    """Create dst as a copy-on-write clone of src. Raises OSError where unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("Reflinks are not supported on this platform.")
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def place_file(src, dst, methods=LINK_METHODS):
+    """
+    Put src's contents at dst using the first of methods that works; dst is
+    replaced atomically (temp file + os.replace).
+    Args:
+        src (str): Existing file.
+        dst (str): Destination path.
+        methods (tuple): Any of 'hardlink', 'reflink' and 'copy', in order of preference.
+    Returns:
+        str: The method used, or "unchanged" when dst already is src.
+    Raises:
+        OSError: If every method failed (the last error).
+    """
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    try:
+        if os.path.samefile(src, dst):
+            # Already linked there (a re-run over its own output): nothing to place.
+            return "unchanged"
+    except OSError:
+        pass
+    tmp_path = temp_path(dst)
+    error = OSError(f"No link method given for {dst}")
+    for method in methods:
+        try:
+            if method == "hardlink":
+                os.link(src, tmp_path)
+            elif method == "reflink":
+                reflink(src, tmp_path)
+            else:
+                shutil.copy2(src, tmp_path)
+        except OSError as e:
+            error = e
+            continue
+        try:
+            os.replace(tmp_path, dst)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+        return method
+    raise error
+
+
+def is_unchanged(src, dst, same_size=True):
+    """
+    Return True if dst exists with the same size and mtime as src (a previous copy or link).
+    With same_size=False only the mtime is compared: re-encoded outputs are given their
+    input's mtime, so a matching one is a previous re-encode of the same input.
+    """
+    try:
+        s, d = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    return (not same_size or s.st_size == d.st_size) and s.st_mtime_ns == d.st_mtime_ns
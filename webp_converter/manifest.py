@@ -0,0 +1,108 @@
+"""
+manifest.py
+Incremental conversion manifest: remembers which inputs produced which outputs
+so unchanged files can be skipped on the next run without being decoded.
+"""
+import os
+import json
+import time
+import hashlib
+
+MANIFEST_NAME = ".webp-converter-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Return the BLAKE2b hex digest of a file's contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ConversionManifest:
+    """
+    Manifest stored in the output directory, keyed by output path (relative to it).
+    Each entry records the input's size, mtime, optional content hash and the
+    conversion parameters that produced the output.
+    Recorded conversions are saved every save_every records or save_interval seconds,
+    whichever comes first, so a run that is killed only redoes the last few files.
+    """
+
+    def __init__(self, output_dir, use_hash=False, save_every=1000, save_interval=10.0):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.use_hash = use_hash
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.entries = {}
+        self.dirty = False
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == MANIFEST_VERSION:
+            self.entries = data.get("entries", {})
+
+    def save(self):
+        """Write the manifest atomically (temp file + rename)."""
+        if not self.dirty:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+
+    def _key(self, output_path):
+        return os.path.relpath(output_path, self.output_dir)
+
+    @staticmethod
+    def _normalize(params):
+        # Compare parameters the way they are stored (tuples become lists, etc.).
+        return json.loads(json.dumps(params))
+
+    def is_up_to_date(self, input_path, output_path, params):
+        """
+        Return True if output_path exists and was produced from an unchanged input
+        with the same parameters. Only stats the input unless its size/mtime changed
+        and hashing is enabled.
+        """
+        entry = self.entries.get(self._key(output_path))
+        if entry is None or entry["params"] != self._normalize(params) or not os.path.exists(output_path):
+            return False
+        st = os.stat(input_path)
+        if entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return True
+        if self.use_hash and entry.get("hash") and entry["size"] == st.st_size:
+            if file_hash(input_path) == entry["hash"]:
+                # Same content, new mtime (e.g. re-copied tree): refresh the entry.
+                entry["mtime_ns"] = st.st_mtime_ns
+                self.dirty = True
+                return True
+        return False
+
+    def record(self, input_path, output_path, params):
+        """Record a successful conversion of input_path into output_path."""
+        st = os.stat(input_path)
+        self.entries[self._key(output_path)] = {
+            "input": os.path.abspath(input_path),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "hash": file_hash(input_path) if self.use_hash else None,
+            "params": self._normalize(params),
+        }
+        self.dirty = True
+        self._unsaved += 1
+        if self._unsaved >= self.save_every or time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
@@ -0,0 +1,389 @@
+"""
+parallel.py
+Process-pool execution engine for batch conversions.
+"""
+import io
+import os
+import time
+import multiprocessing
+from collections import deque
+from contextlib import nullcontext
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from .budget import check_pixels, configure_max_pixels, estimate_job_bytes
+from .classify import AUTO, resolve_encoding
+from .image_utils import convert_image_file, prepare_for_webp, shrink_on_load
+from .links import LINK_MODES, is_unchanged, place_file
+from .threads import apply_thread_budget, available_cpus, plan_threads
+from .timing import stage, track
+from .variants import convert_variants
+from .writer import AsyncWriter, PendingWrites, write_output
+
+# Each worker process writes its outputs through one AsyncWriter (see _init_worker).
+_writer = None
+
+CONVERT_MODE = "Convert to WebP"
+RESIZE_MODE = "Resize Only (retain original format)"
+
+
+def default_workers():
+    """Return the default number of worker processes (one per available CPU)."""
+    return available_cpus()
+
+
+def resize_and_save(input_path, output_path, max_size=None, writer=None):
+    """
+    Re-save an image in the format implied by output_path, scaling it down to fit
+    within max_size x max_size pixels if given (decoding at reduced scale where possible).
+    The output is written atomically, in the background if a writer is given.
+    Returns:
+        int: Size of the encoded output in bytes.
+    """
+    format = Image.registered_extensions().get(os.path.splitext(output_path)[1].lower())
+    if format is None:
+        raise ValueError(f"unknown file extension: {os.path.splitext(output_path)[1]}")
+    with Image.open(input_path) as img:
+        if max_size and max(img.size) > max_size:
+            scale = max_size / max(img.size)
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            with stage("decode"):
+                img = shrink_on_load(img, size)
+                img.load()
+            with stage("resize"):
+                img = img.resize(size, Image.Resampling.LANCZOS)
+        else:
+            with stage("decode"):
+                img = img.copy()
+        with stage("encode"), io.BytesIO() as buf:
+            img.save(buf, format)
+            data = buf.getvalue()
+    write_output(output_path, data, writer)
+    return len(data)
+
+
+def process_file(
+    input_path,
+    output_path,
+    action,
+    mode,
+    quality=80,
+    lossless=False,
+    remove_bg=False,
+    bg_model=None,
+    max_size=None,
+    variants=None,
+    target=None,
+    trace=False,
+    writer=None,
+    max_pixels=None,
+    link="auto",
+    reencode_webp=None,
+    animation=None,
+):
+    """
+    Process a single (input, output, action) job. Never raises.
+    Args:
+        input_path (str): Path to the input image.
+        output_path (str): Path to write the result to.
+        action (str): 'convert' or 'copy' (already WebP; placed with the link mode, or
+            skipped if the output already matches the input's size and mtime).
+        mode (str): Operation mode chosen in the CLI.
+        quality (int): WebP quality (0-100).
+        lossless (bool or str): If True, use lossless WebP; 'auto' chooses per image
+            (see classify.choose_encoding).
+        remove_bg (bool): If True, remove image backgrounds.
+        bg_model (str): rembg model used for background removal (None for the default).
+        max_size (int): In resize mode, the maximum width/height (None keeps the size).
+        variants (list): VariantSpec tuples; if set, converted files fan out into one WebP
+            per variant and output_path is the srcset manifest (see variants.convert_variants).
+        target (autotune.QualityTarget): Automatic quality target for converted files.
+        trace (bool): If True, add per-stage timings under 'trace' (see timing.FileTrace).
+        writer (writer.AsyncWriter): Write outputs in the background. The record then
+            carries the pending writes and must be passed to finish_result.
+        max_pixels (int): Fail images with more pixels than this (see budget.check_pixels).
+        link (str): How 'copy' jobs place files: 'auto' (reflink, else copy),
+            'hardlink' (hardlink, else reflink, else copy) or 'copy'.
+        reencode_webp (float): In convert mode, re-encode existing WebP files with
+            quality/lossless instead of copying them if that saves more than this percent.
+        animation (dict): Encoder options for animated inputs (see animation.ANIMATION_OPTIONS).
+    Returns:
+        dict: Result record with input, output, action, error (None on success) and
+        duration, plus the sizes reported by the conversion for converted files.
+    """
+    result = {"input": input_path, "output": output_path, "action": action, "error": None}
+    start = time.perf_counter()
+    pending = PendingWrites(writer) if writer is not None else None
+    with track(input_path) if trace else nullcontext() as file_trace:
+        try:
+            _process(input_path, output_path, action, mode, result, quality, lossless,
+                     remove_bg, bg_model, max_size, variants, target, pending, max_pixels, link, reencode_webp,
+                     animation)
+        except Exception as e:
+            result["error"] = str(e)
+    if pending is not None:
+        result["pending"] = pending
+    if file_trace is not None:
+        result["trace"] = file_trace.as_record()
+    result["duration"] = time.perf_counter() - start
+    return result
+
+
+def _reencode_if_smaller(input_path, size, quality, lossless, min_saving):
+    """Return a re-encoded WebP if it is more than min_saving percent smaller, else None."""
+    with Image.open(input_path) as img:
+        if getattr(img, "is_animated", False):
+            return None
+        with stage("decode"):
+            img.load()
+        img = prepare_for_webp(img)
+        options = {"quality": quality, "lossless": lossless}
+        if lossless == AUTO:
+            with stage("classify"):
+                img, options, _ = resolve_encoding(img, quality)
+        with stage("encode"), io.BytesIO() as buf:
+            img.save(buf, "WEBP", **options)
+            data = buf.getvalue()
+    return data if len(data) < size * (1 - min_saving / 100) else None
+
+
+def finish_result(result):
+    """Wait for a record's background writes and report the first failure as its error."""
+    pending = result.pop("pending", None)
+    if pending is not None:
+        error = pending.wait()
+        if error is not None and result["error"] is None:
+            result["error"] = error
+    return result
+
+
+def _process(input_path, output_path, action, mode, result, quality, lossless,
+             remove_bg, bg_model, max_size, variants, target, writer, max_pixels, link, reencode_webp,
+             animation):
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if action != "copy":
+        check_pixels(input_path, max_pixels)
+    if action == "copy":
+        size = os.path.getsize(input_path)
+        result.update(original_size=size, new_size=size)
+        reencode = reencode_webp is not None and mode == CONVERT_MODE
+        if is_unchanged(input_path, output_path, same_size=not reencode):
+            # A previous copy, link or (with reencode) re-encode of this input.
+            result.update(new_size=os.path.getsize(output_path), link="unchanged")
+            return
+        if reencode:
+            check_pixels(input_path, max_pixels)
+            data = _reencode_if_smaller(input_path, size, quality, lossless, reencode_webp)
+            if data is not None:
+                # Stamped with the input's mtime so the next run can tell it is up to date.
+                write_output(output_path, data, writer, mtime_ns=os.stat(input_path).st_mtime_ns)
+                result.update(new_size=len(data), reencoded=True, quality=quality)
+                return
+            if is_unchanged(input_path, output_path):
+                result["link"] = "unchanged"
+                return
+        with stage("copy"):
+            result["link"] = place_file(input_path, output_path, LINK_MODES[link])
+    elif mode == RESIZE_MODE:
+        new_size = resize_and_save(input_path, output_path, max_size=max_size, writer=writer)
+        result.update(original_size=os.path.getsize(input_path), new_size=new_size)
+    elif variants:
+        result.update(
+            convert_variants(
+                input_path, output_path, variants, remove_bg=remove_bg, bg_model=bg_model, writer=writer
+            )
+        )
+    else:
+        result.update(
+            convert_image_file(
+                input_path,
+                output_path,
+                quality=quality,
+                remove_bg=remove_bg,
+                lossless=lossless,
+                bg_model=bg_model,
+                target=target,
+                writer=writer,
+                animation=animation,
+            )
+        )
+
+
+def _init_worker(remove_bg, bg_model, fsync=False, max_pixels=None, threads=None):
+    global _writer
+    if threads is not None:
+        apply_thread_budget(threads["intra_op"], threads["inter_op"])
+    _writer = AsyncWriter(fsync=fsync)
+    configure_max_pixels(max_pixels)
+    if not remove_bg:
+        return
+    try:
+        from .bg_removal import warm_up
+        warm_up(bg_model)
+    except Exception:
+        # A failing initializer breaks the whole pool; let each job report the error instead.
+        pass
+
+
+def _run_chunk(chunk):
+    # Encoding of the next file overlaps the writes of the previous ones.
+    results = [process_file(i, o, a, mode, writer=_writer, **options) for i, o, a, mode, options in chunk]
+    results = [finish_result(result) for result in results]
+    if _writer.fsync:
+        _writer.sync_dirs()
+    return results
+
+
+def _failed_chunk(chunk, error):
+    """Error records for the jobs of a chunk whose worker died."""
+    return [
+        {"input": i, "output": o, "action": a, "error": f"Worker failed: {error}", "duration": 0.0}
+        for i, o, a, _, _ in chunk
+    ]
+
+
+def run_parallel(files_to_convert, mode, workers=None, progress=None, fsync=False, memory_budget=None,
+                 ort_threads=None, **options):
+    """
+    Run jobs across a pool of worker processes, yielding result records in input order.
+    Jobs are pulled lazily and at most a few chunks per worker are in flight, so
+    files_to_convert may be a generator (e.g. a scanner.ScanQueue) of any length.
+    Args:
+        files_to_convert (iterable): (input_path, output_path, action) tuples.
+        mode (str): Operation mode chosen in the CLI.
+        workers (int): Number of worker processes. Defaults to the CPU count (or, with
+            ort_threads, as many as fit); 1 runs the jobs in the calling process.
+        progress: Optional progress bar; update(1) is called for every finished job.
+        fsync (bool): If True, sync every output to disk before renaming it into place.
+        memory_budget (int): If set, bytes of estimated peak memory (see
+            budget.estimate_job_bytes) allowed across running chunks; a chunk that
+            does not fit waits, and one larger than the budget runs alone.
+        ort_threads (int): onnxruntime threads per worker for background removal.
+            Defaults to the cores left per worker (see threads.plan_threads).
+        options: quality, lossless, remove_bg, bg_model, max_size, variants, target,
+            trace and max_pixels, passed to process_file.
+            With remove_bg, each worker loads the rembg session once when it starts.
+    """
+    threads = plan_threads(workers, ort_threads, bg_share=1.0 if options.get("remove_bg") else 0.0)
+    workers = threads["workers"]
+    configure_max_pixels(options.get("max_pixels"))
+    if workers == 1:
+        # As in a worker: the budget has to be in place before rembg's session is created.
+        apply_thread_budget(threads["intra_op"], threads["inter_op"])
+        writer = AsyncWriter(fsync=fsync)
+        window = deque()
+        try:
+            for input_path, output_path, action in files_to_convert:
+                window.append(process_file(input_path, output_path, action, mode, writer=writer, **options))
+                # Keep a couple of files in flight so encoding overlaps writing.
+                if len(window) > 2:
+                    result = finish_result(window.popleft())
+                    if progress is not None:
+                        progress.update(1)
+                    yield result
+            while window:
+                result = finish_result(window.popleft())
+                if progress is not None:
+                    progress.update(1)
+                yield result
+        finally:
+            writer.close()
+        return
+    known = len(files_to_convert) if hasattr(files_to_convert, "__len__") else None
+    jobs = iter(files_to_convert)
+    max_pending = workers * 4
+    pending = deque()
+    submitted = 0
+    in_flight = 0
+    running = {}  # future -> estimated bytes, for chunks not finished yet (memory budget only)
+    held = None
+    # Spawn (not fork): forking after rembg/onnxruntime are loaded deadlocks at exit.
+    context = multiprocessing.get_context("spawn")
+
+    def start_pool():
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(options.get("remove_bg", False), options.get("bg_model"), fsync, options.get("max_pixels"), threads),
+        )
+
+    pool = start_pool()
+
+    def restart():
+        nonlocal pool
+        pool.shutdown(wait=False)
+        pool = start_pool()
+
+    def submit(chunk):
+        try:
+            return pool.submit(_run_chunk, chunk), pool
+        except BrokenProcessPool:
+            # The pool broke while we were waiting on an earlier chunk.
+            restart()
+            return pool.submit(_run_chunk, chunk), pool
+
+    def release():
+        nonlocal in_flight
+        # A chunk's memory is freed when it finishes, not when its results are collected.
+        for future in [f for f in running if f.done()]:
+            in_flight -= running.pop(future)
+
+    def fill():
+        nonlocal submitted, in_flight, held
+        release()
+        while len(pending) < max_pending:
+            if held is not None:
+                chunk, cost = held
+                held = None
+            else:
+                # Unknown length: start with single files, grow chunks as the job count does.
+                total = known if known is not None else submitted
+                size = max(1, min(64, total // max_pending))
+                chunk = [(i, o, a, mode, options) for i, o, a in islice(jobs, size)]
+                if not chunk:
+                    return
+                submitted += len(chunk)
+                cost = 0
+                if memory_budget:
+                    # A chunk's jobs run one after another, so its peak is its largest job.
+                    cost = max(estimate_job_bytes(i, a, options.get("remove_bg")) for i, _, a, _, _ in chunk)
+            if memory_budget and running and (len(running) >= workers or in_flight + cost > memory_budget):
+                # Only chunks that run count against the budget, so do not queue more than
+                # the workers can take; an oversized chunk waits until it can run alone.
+                held = (chunk, cost)
+                return
+            future, chunk_pool = submit(chunk)
+            if memory_budget:
+                in_flight += cost
+                running[future] = cost
+            pending.append((future, chunk_pool, chunk))
+
+    try:
+        fill()
+        while pending:
+            future, chunk_pool, chunk = pending[0]
+            if held is not None and not future.done():
+                # Chunks behind the oldest one may finish first and make room meanwhile.
+                wait(running, return_when=FIRST_COMPLETED)
+                fill()
+                continue
+            pending.popleft()
+            try:
+                results = future.result()
+            except BrokenProcessPool as e:
+                # A worker died (e.g. killed by the OOM killer) and the pool failed every
+                # chunk it still had. Report those files and go on with a new pool.
+                results = _failed_chunk(chunk, e)
+                if chunk_pool is pool:
+                    restart()
+            fill()
+            for result in results:
+                if progress is not None:
+                    progress.update(1)
+                yield result
+    finally:
+        for future, _, _ in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
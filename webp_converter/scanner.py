@@ -0,0 +1,128 @@
+"""
+scanner.py
+Streaming input discovery: walks folders with os.scandir and yields conversion jobs
+as they are found, so conversion can start before a large tree is fully scanned.
+"""
+import os
+import queue
+import threading
+from functools import lru_cache
+
+_DONE = object()
+
+
+@lru_cache(maxsize=None)
+def image_extensions():
+    """Lower-case extensions (with the dot) of every format Pillow can open."""
+    from PIL import Image
+    return frozenset(ext.lower() for ext in Image.registered_extensions())
+
+
+def _is_image_name(name, extensions):
+    dot = name.rfind(".")
+    return dot >= 0 and name[dot:].lower() in extensions
+
+
+def scan_images(directory, exclude=()):
+    """
+    Recursively yield image file paths under directory, top-down like os.walk.
+    Symlinked folders, unreadable folders and the folders in exclude (e.g. an output
+    folder inside the input tree) are skipped.
+    """
+    extensions = image_extensions()
+    excluded = {os.path.abspath(path) for path in exclude}
+    stack = [directory]
+    while stack:
+        subdirs = []
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if not entry.is_symlink() and os.path.abspath(entry.path) not in excluded:
+                            subdirs.append(entry.path)
+                    elif _is_image_name(entry.name, extensions):
+                        yield entry.path
+        except OSError:
+            continue
+        stack.extend(reversed(subdirs))
+
+
+def output_path_for(input_path, output_dir, input_root=None):
+    """
+    Map an input file to its output path: WebP files keep their name, everything else
+    gets a '.webp' extension. With input_root, the path relative to it is preserved.
+    Returns:
+        (str, str): Output path and action ('copy' for WebP inputs, else 'convert').
+    """
+    rel_path = os.path.relpath(input_path, input_root) if input_root else os.path.basename(input_path)
+    if input_path.lower().endswith(".webp"):
+        return os.path.join(output_dir, rel_path), "copy"
+    return os.path.join(output_dir, os.path.splitext(rel_path)[0] + ".webp"), "convert"
+
+
+def iter_jobs(inputs, output_dir):
+    """
+    Yield (input_path, output_path, action) for files and folders in inputs. An
+    output_dir inside an input folder is not scanned, so outputs are never fed back in.
+    """
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            for input_file in scan_images(input_path, exclude=(output_dir,)):
+                yield (input_file, *output_path_for(input_file, output_dir, input_path))
+        else:
+            yield (input_path, *output_path_for(input_path, output_dir))
+
+
+class ScanQueue:
+    """
+    Runs a job iterator on a background thread and hands jobs over through a bounded
+    queue, so scanning overlaps with conversion and memory stays flat.
+    `found` counts the jobs seen so far and `done` is set once scanning has finished.
+    """
+
+    def __init__(self, jobs, maxsize=10000):
+        self.found = 0
+        self.done = False
+        self._error = None
+        self._closed = False
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._fill, args=(jobs,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._closed:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self, jobs):
+        try:
+            for job in jobs:
+                self.found += 1
+                if not self._put(job):
+                    return
+        except Exception as e:
+            self._error = e
+        finally:
+            self.done = True
+            self._put(_DONE)
+
+    def __iter__(self):
+        while True:
+            job = self._queue.get()
+            if job is _DONE:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield job
+
+    def close(self):
+        """Stop scanning early (e.g. when the consumer gives up)."""
+        self._closed = True
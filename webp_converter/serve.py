@@ -0,0 +1,580 @@
+"""
+serve.py
+Long-running conversion service: POST image bytes over HTTP (TCP on localhost or a
+Unix socket) and get WebP bytes back, without paying interpreter startup and the
+rembg import per image.
+"""
+import io
+import os
+import sys
+import time
+import queue
+import argparse
+import stat
+import signal
+import threading
+import socketserver
+import multiprocessing
+from bisect import bisect_left
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from .autotune import parse_size
+from .classify import AUTO
+from .converter import Converter
+from .threads import apply_thread_budget, plan_threads
+
+# Prometheus-style upper bounds, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+# Background-removal requests at or below this many pixels are micro-batched.
+SMALL_IMAGE_PIXELS = 1024 * 1024
+_STOP = object()
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus text format."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def render(self):
+        with self._lock:
+            counts, total_sum = list(self.counts), self.sum
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total_sum:.6f}")
+        lines.append(f"{self.name}_count {cumulative}")
+        return "\n".join(lines)
+
+
+class Metrics:
+    """Request counters, queue depth and latency histograms for /metrics."""
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            "webp_request_duration_seconds", "Time from receiving a request body to sending the result.",
+            LATENCY_BUCKETS,
+        )
+        self.queue_seconds = Histogram(
+            "webp_queue_wait_seconds", "Time a request waited before a worker picked it up.", LATENCY_BUCKETS,
+        )
+        self.convert_seconds = Histogram(
+            "webp_convert_duration_seconds", "Time a worker spent converting one image.", LATENCY_BUCKETS,
+        )
+        self.batch_size = Histogram(
+            "webp_batch_size", "Requests per micro-batch sent to a worker.", BATCH_SIZE_BUCKETS,
+        )
+        self.responses = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+
+    def count_response(self, status, bytes_in=0, bytes_out=0):
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def render(self, queue_depth, in_flight):
+        with self._lock:
+            responses = sorted(self.responses.items())
+            bytes_in, bytes_out = self.bytes_in, self.bytes_out
+        lines = ["# HELP webp_responses_total Responses by HTTP status.", "# TYPE webp_responses_total counter"]
+        lines += [f'webp_responses_total{{status="{status}"}} {n}' for status, n in responses]
+        lines += [
+            "# HELP webp_bytes_total Image bytes received and returned.",
+            "# TYPE webp_bytes_total counter",
+            f'webp_bytes_total{{direction="in"}} {bytes_in}',
+            f'webp_bytes_total{{direction="out"}} {bytes_out}',
+            "# HELP webp_queue_depth Requests waiting for a worker.",
+            "# TYPE webp_queue_depth gauge",
+            f"webp_queue_depth {queue_depth}",
+            "# HELP webp_in_flight_batches Batches running on or queued for the workers.",
+            "# TYPE webp_in_flight_batches gauge",
+            f"webp_in_flight_batches {in_flight}",
+        ]
+        for histogram in (self.request_seconds, self.queue_seconds, self.convert_seconds, self.batch_size):
+            lines.append(histogram.render())
+        return "\n".join(lines) + "\n"
+
+
+def _init_worker(remove_bg, bg_model, threads):
+    # Ctrl-C reaches the whole process group; the server shuts the workers down itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    apply_thread_budget(threads["intra_op"], threads["inter_op"])
+    if not remove_bg:
+        return
+    try:
+        from .bg_removal import warm_up
+        warm_up(bg_model)
+    except Exception:
+        # Leave the error to the requests that need background removal.
+        pass
+
+
+# Per-worker Converters, one per option set, reused across requests.
+_converters = {}
+
+
+def _converter(options):
+    key = tuple(sorted(options.items()))
+    converter = _converters.get(key)
+    if converter is None:
+        converter = _converters[key] = Converter(**options)
+    return converter
+
+
+def _run_batch(batch):
+    # One task per micro-batch; each request gets its own result or error.
+    results = []
+    for data, options in batch:
+        start = time.perf_counter()
+        try:
+            output, record = _converter(options).convert(data)
+            result = {"data": output, "error": None, **{k: record[k] for k in ("frames", "mode", "bg_skipped")}}
+            result["skipped_options"] = record.get("skipped_options", [])
+        except Exception as e:
+            result = {"error": str(e)}
+        result["duration"] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+class _Request:
+    __slots__ = ("data", "options", "batchable", "future", "queued_at")
+
+    def __init__(self, data, options, batchable):
+        self.data = data
+        self.options = options
+        self.batchable = batchable
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+
+class ConversionService:
+    """
+    Warm worker processes behind a bounded request queue. A dispatcher thread groups
+    small background-removal requests into micro-batches (up to batch_size, waiting
+    at most batch_window seconds for more) and keeps at most two batches per worker
+    in flight, so a burst queues here, where submit() can refuse it, rather than in
+    the pool. Cores are split between workers and their onnxruntime threads by
+    threads.plan_threads, for the expected bg_share of background-removal requests
+    (default: all of them with remove_bg, otherwise only the occasional one).
+    """
+
+    def __init__(self, workers=None, queue_size=64, batch_size=8, batch_window=0.005,
+                 remove_bg=False, bg_model=None, metrics=None, ort_threads=None, bg_share=None):
+        if bg_share is None:
+            bg_share = 1.0 if remove_bg else 0.0
+        self.threads = plan_threads(workers, ort_threads, bg_share)
+        self.workers = self.threads["workers"]
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.bg_model = bg_model
+        self.metrics = metrics or Metrics()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._remove_bg = remove_bg
+        self.restarts = 0
+        self._pool = self._start_pool()
+        self._dispatcher = threading.Thread(target=self._dispatch, name="webp-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    def _start_pool(self):
+        # Spawn (not fork): forking after rembg/onnxruntime are loaded deadlocks at exit.
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self._remove_bg, self.bg_model, self.threads),
+        )
+
+    def _restart(self, broken):
+        """Replace the pool if it is still the broken one (a worker died, e.g. out of memory)."""
+        with self._lock:
+            if self._pool is not broken:
+                return
+            self._pool = self._start_pool()
+            self.restarts += 1
+        broken.shutdown(wait=False)
+
+    def healthy(self):
+        """
+        Return False if a worker has died and taken the pool down; a new pool is
+        started then, so the service recovers without a request having to fail first.
+        """
+        pool = self._pool
+        # ProcessPoolExecutor only exposes this state by failing the next submit.
+        if getattr(pool, "_broken", False):
+            self._restart(pool)
+            return False
+        return True
+
+    def warm_up(self):
+        """Start every worker now (loading the model if remove_bg) instead of on the first requests."""
+        for future in [self._pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def submit(self, data, quality=80, lossless=False, remove_bg=False):
+        """
+        Queue one image. Returns a concurrent.futures.Future for the result
+        (with 'error' set instead of raising), or None if the queue is full.
+        """
+        options = {"quality": quality, "lossless": lossless, "remove_bg": remove_bg, "bg_model": self.bg_model}
+        batchable = remove_bg and _pixels(data) <= SMALL_IMAGE_PIXELS
+        request = _Request(data, options, batchable)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            return None
+        return request.future
+
+    def _dispatch(self):
+        held = None
+        while True:
+            request = held if held is not None else self._queue.get()
+            held = None
+            if request is _STOP:
+                return
+            batch = [request]
+            if request.batchable:
+                deadline = time.perf_counter() + self.batch_window
+                while len(batch) < self.batch_size:
+                    try:
+                        nxt = self._queue.get(timeout=max(deadline - time.perf_counter(), 0))
+                    except queue.Empty:
+                        break
+                    if nxt is _STOP or not nxt.batchable:
+                        held = nxt
+                        break
+                    batch.append(nxt)
+            self._slots.acquire()
+            self._start(batch)
+
+    def _start(self, batch):
+        now = time.perf_counter()
+        for request in batch:
+            self.metrics.queue_seconds.observe(now - request.queued_at)
+        self.metrics.batch_size.observe(len(batch))
+        with self._lock:
+            self._in_flight += 1
+        work = [(r.data, r.options) for r in batch]
+        pool = self._pool
+        try:
+            try:
+                future = pool.submit(_run_batch, work)
+            except BrokenProcessPool:
+                # A worker died since the last batch; this one gets a new pool.
+                self._restart(pool)
+                pool = self._pool
+                future = pool.submit(_run_batch, work)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(lambda f: self._finish(batch, f, pool))
+
+    def _finish(self, batch, future, pool):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+        try:
+            results = future.result()
+        except Exception as e:
+            # The worker died (e.g. out of memory): fail the batches that were in
+            # flight on its pool, and carry on with a new one.
+            if isinstance(e, BrokenProcessPool):
+                self._restart(pool)
+            results = [{"error": f"Worker failed: {e}", "worker_failed": True} for _ in batch]
+        for request, result in zip(batch, results):
+            if "duration" in result:
+                self.metrics.convert_seconds.observe(result["duration"])
+            request.future.set_result(result)
+
+    def close(self):
+        """Finish queued requests, then stop the dispatcher and the workers."""
+        self._queue.put(_STOP)
+        self._dispatcher.join()
+        self._pool.shutdown(wait=True)
+
+
+def _pixels(data):
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.width * img.height
+    except Exception:
+        return 0
+
+
+def _flag(value):
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    """
+    POST /convert (body: image bytes; query: quality, lossless (1/0/auto), remove_bg) -> image/webp.
+    GET /metrics -> Prometheus text; GET /healthz -> 'ok' (503 if the worker pool broke).
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "webp-convert"
+
+    def address_string(self):
+        # Unix socket peers have no address.
+        return self.client_address[0] if self.client_address else self.server.server_address
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _reply(self, status, body, content_type="text/plain; charset=utf-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        service = self.server.service
+        if path == "/metrics":
+            self._reply(200, service.metrics.render(service.queue_depth, service.in_flight),
+                        "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/healthz":
+            if service.healthy():
+                self._reply(200, "ok\n")
+            else:
+                self._reply(503, "Worker pool broke; restarting.\n", headers={"Retry-After": "1"})
+        else:
+            self._reply(404, "Not found.\n")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/convert":
+            self._reply(404, "Not found.\n")
+            return
+        metrics = self.server.service.metrics
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            self._fail(411, "Content-Length is required.\n")
+            return
+        if int(length) > self.server.max_body:
+            self.close_connection = True
+            self._fail(413, f"Images are limited to {self.server.max_body} bytes.\n")
+            return
+        data = self.rfile.read(int(length))
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            quality = int(query.get("quality", self.server.quality))
+            if not 0 <= quality <= 100:
+                raise ValueError
+        except ValueError:
+            self._fail(400, "quality must be an integer between 0 and 100.\n")
+            return
+        lossless = query.get("lossless", str(self.server.lossless))
+        lossless = AUTO if lossless.lower() == AUTO else _flag(lossless)
+        remove_bg = _flag(query.get("remove_bg", "0"))
+        if remove_bg and not self.server.remove_bg:
+            self._fail(400, "Background removal is not enabled on this server (start it with --remove-bg).\n")
+            return
+        start = time.perf_counter()
+        future = self.server.service.submit(data, quality=quality, lossless=lossless, remove_bg=remove_bg)
+        if future is None:
+            self._fail(503, "Too many requests queued; retry shortly.\n", {"Retry-After": "1"})
+            return
+        result = future.result()
+        if result.get("worker_failed"):
+            # Not the image's fault: the pool is restarted and a retry may succeed.
+            self._fail(503, f"{result['error']}\n", {"Retry-After": "1"})
+            return
+        if result["error"] is not None:
+            self._fail(422, f"{result['error']}\n")
+            return
+        headers = {
+            "X-Original-Size": str(len(data)),
+            "X-Frames": str(result["frames"]),
+            "X-Compression": result["mode"],
+        }
+        if result["bg_skipped"]:
+            headers["X-Background-Removal"] = "skipped"
+        if result["skipped_options"]:
+            headers["X-Skipped-Options"] = ",".join(result["skipped_options"])
+        self._reply(200, result["data"], "image/webp", headers)
+        metrics.request_seconds.observe(time.perf_counter() - start)
+        metrics.count_response(200, len(data), len(result["data"]))
+
+    def _fail(self, status, message, headers=None):
+        self.server.service.metrics.count_response(status)
+        self._reply(status, message, headers=headers)
+
+
+class _ServerMixin:
+    daemon_threads = True
+    # Let bursts wait in the accept backlog; the request queue decides what is refused.
+    request_queue_size = 128
+
+    def configure(self, service, max_body, quality, lossless, remove_bg, verbose):
+        self.service = service
+        self.max_body = max_body
+        self.quality = quality
+        self.lossless = lossless
+        self.remove_bg = remove_bg
+        self.verbose = verbose
+
+
+class TCPConversionServer(_ServerMixin, ThreadingHTTPServer):
+    pass
+
+
+class UnixConversionServer(_ServerMixin, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    def server_bind(self):
+        if os.path.exists(self.server_address) and stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+            os.unlink(self.server_address)  # stale socket from an earlier run
+        socketserver.UnixStreamServer.server_bind(self)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="webp-convert serve",
+        description="Serve image-to-WebP conversion over HTTP with warm worker processes.",
+        epilog="Example: curl --data-binary @photo.jpg -o photo.webp 'http://127.0.0.1:8080/convert?quality=75'",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="TCP port (default: 8080)")
+    parser.add_argument("--socket", metavar="PATH", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("-q", "--quality", type=int, default=80, help="Default WebP quality 0-100 (default: 80)")
+    compression = parser.add_mutually_exclusive_group()
+    compression.add_argument(
+        "--lossless", action="store_true", help="Use lossless WebP unless a request says otherwise"
+    )
+    compression.add_argument(
+        "--auto-compression",
+        action="store_true",
+        help="Pick lossy, near-lossless or lossless per image unless a request says otherwise",
+    )
+    parser.add_argument(
+        "--remove-bg",
+        action="store_true",
+        help="Load the background-removal model in every worker so requests can ask for remove_bg=1",
+    )
+    parser.add_argument("--bg-model", help="rembg model for background removal (default: rembg's default)")
+    parser.add_argument(
+        "-w", "--workers", type=int,
+        help="Number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--ort-threads", type=int, metavar="N",
+        help="onnxruntime threads per worker for background removal "
+        "(default: from --bg-share; without --workers, runs CPU count / N workers)",
+    )
+    parser.add_argument(
+        "--bg-share", type=float, metavar="FRACTION",
+        help="Expected share of requests with background removal, 0-1, used to size the "
+        "onnxruntime threads (default: 1 with --remove-bg, else 0)",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=64,
+        help="Requests allowed to wait for a worker; more are refused with 503 (default: 64)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Most small background-removal requests sent to a worker together (default: 8)",
+    )
+    parser.add_argument(
+        "--batch-window",
+        type=float,
+        default=5.0,
+        metavar="MS",
+        help="How long a micro-batch waits for more requests, in milliseconds (default: 5)",
+    )
+    parser.add_argument("--max-body", default="50M", help="Largest accepted upload (default: 50M)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log every request to stderr")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not 0 <= args.quality <= 100:
+        parser.error("--quality must be between 0 and 100")
+    for flag in ("workers", "ort_threads", "queue_size", "batch_size"):
+        if getattr(args, flag) is not None and getattr(args, flag) < 1:
+            parser.error(f"--{flag.replace('_', '-')} must be at least 1")
+    if args.bg_share is not None and not 0 <= args.bg_share <= 1:
+        parser.error("--bg-share must be between 0 and 1")
+    if args.batch_window < 0:
+        parser.error("--batch-window must be 0 or more")
+    try:
+        max_body = parse_size(args.max_body)
+    except ValueError:
+        parser.error(f"--max-body: invalid size '{args.max_body}'")
+
+    service = ConversionService(
+        workers=args.workers,
+        queue_size=args.queue_size,
+        batch_size=args.batch_size,
+        batch_window=args.batch_window / 1000,
+        remove_bg=args.remove_bg,
+        bg_model=args.bg_model,
+        ort_threads=args.ort_threads,
+        bg_share=args.bg_share,
+    )
+    if args.socket:
+        server = UnixConversionServer(args.socket, ConversionHandler)
+        where = args.socket
+    else:
+        server = TCPConversionServer((args.host, args.port), ConversionHandler)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    lossless = AUTO if args.auto_compression else args.lossless
+    server.configure(service, max_body, args.quality, lossless, args.remove_bg, args.verbose)
+    service.warm_up()
+    print(
+        f"Serving on {where} with {service.workers} workers, {service.threads['intra_op']} "
+        "inference threads each (Ctrl-C to stop)",
+        file=sys.stderr,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 0
@@ -0,0 +1,75 @@
+"""
+threads.py
+CPU thread budget: splits the available cores between worker processes and the
+onnxruntime threads each of them uses for background removal, so a multi-process
+batch does not run workers x cores inference threads.
+"""
+import os
+
+# Native libraries that size their thread pools from these when first imported.
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+# Set in each worker by apply_thread_budget; read by session_options.
+_ort_threads = None
+
+
+def available_cpus():
+    """Return the number of CPUs this process may run on (its affinity mask, where known)."""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan_threads(workers=None, ort_threads=None, bg_share=1.0, cpus=None):
+    """
+    Split the CPUs between worker processes and per-worker onnxruntime threads.
+    Decoding and encoding use one core per worker; only inference is multi-threaded.
+    So the cores not taken by workers that are encoding are shared among the ones
+    expected to be running inference at the same time.
+    Args:
+        workers (int): Worker processes. None: cpus // ort_threads if ort_threads is
+            given, else one per CPU.
+        ort_threads (int): onnxruntime intra-op threads per worker. None derives it
+            from workers and bg_share.
+        bg_share (float): Share of jobs expected to run background removal (0-1).
+            With a lower share, fewer workers infer at once and each gets more threads.
+        cpus (int): CPUs to plan for (default: available_cpus()).
+    Returns:
+        dict: workers, intra_op and inter_op (threads per worker).
+    """
+    cpus = cpus or available_cpus()
+    if workers is None:
+        workers = max(1, cpus // ort_threads) if ort_threads else cpus
+    if ort_threads is None:
+        inferring = min(workers, max(1, round(workers * bg_share)))
+        free = max(1, cpus - (workers - inferring))
+        ort_threads = max(1, free // inferring)
+    # rembg's models are single chains of operators: inter-op parallelism has nothing to run.
+    return {"workers": workers, "intra_op": ort_threads, "inter_op": 1}
+
+
+def apply_thread_budget(intra_op, inter_op=1):
+    """
+    Limit this process's native thread pools. Call it at worker start, before numpy
+    or onnxruntime are imported. Variables the user has set are left alone.
+    """
+    global _ort_threads
+    for name in THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(intra_op))
+    _ort_threads = (intra_op, inter_op)
+
+
+def session_options():
+    """
+    Return onnxruntime SessionOptions for the budget set by apply_thread_budget, or
+    None (onnxruntime's defaults: one thread per physical core) if none was set.
+    """
+    if _ort_threads is None:
+        return None
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads, options.inter_op_num_threads = _ort_threads
+    # Idle pool threads would otherwise spin and take cores from the other workers.
+    options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    return options
@@ -0,0 +1,152 @@
+"""
+timing.py
+Opt-in per-file, per-stage timing instrumentation with Chrome-trace / JSON-lines
+export and a percentile summary. Stages are no-ops unless a file is being tracked.
+"""
+import os
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class FileTrace:
+    """Stage durations and counters (bytes_in, bytes_out, pixels) for one file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = []
+        self.counters = {}
+
+    def as_record(self):
+        return {
+            "path": self.path,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "stages": self.stages,
+            **self.counters,
+        }
+
+
+@contextmanager
+def track(path):
+    """Collect stages recorded on this thread while processing `path`."""
+    trace = FileTrace(path)
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def current_trace():
+    """Return the FileTrace tracked on this thread, or None."""
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def resume(trace):
+    """Record stages on this thread into an existing FileTrace (e.g. from an I/O thread)."""
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage for the file currently tracked on this thread (if any)."""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        yield
+        return
+    wall = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.stages.append({"stage": name, "ts": wall, "dur": time.perf_counter() - start})
+
+
+def count(**counters):
+    """Add to counters such as bytes_in, bytes_out or pixels for the tracked file."""
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        for key, value in counters.items():
+            trace.counters[key] = trace.counters.get(key, 0) + value
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class TraceWriter:
+    """
+    Streams trace records to a file and aggregates per-stage durations.
+    Files ending in '.jsonl' get one JSON record per file; anything else gets
+    Chrome trace events (open in chrome://tracing or Perfetto).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chrome = not path.endswith(".jsonl")
+        self.durations = {}
+        self.totals = {"bytes_in": 0, "bytes_out": 0, "pixels": 0}
+        self._first = True
+        self._file = open(path, "w", encoding="utf-8")
+        if self.chrome:
+            self._file.write("[\n")
+
+    def add(self, record):
+        for item in record["stages"]:
+            self.durations.setdefault(item["stage"], []).append(item["dur"])
+        for key in self.totals:
+            self.totals[key] += record.get(key, 0)
+        if not self.chrome:
+            self._file.write(json.dumps(record) + "\n")
+            return
+        for item in record["stages"]:
+            event = {
+                "name": item["stage"],
+                "cat": "convert",
+                "ph": "X",
+                "ts": round(item["ts"] * 1e6),
+                "dur": round(item["dur"] * 1e6),
+                "pid": record["pid"],
+                "tid": record["tid"],
+                "args": {"file": record["path"]},
+            }
+            self._file.write(("" if self._first else ",\n") + json.dumps(event))
+            self._first = False
+
+    def close(self):
+        if self.chrome:
+            self._file.write("\n]\n")
+        self._file.close()
+
+    def summary(self):
+        """Return a p50/p95/p99 per-stage table (milliseconds) as text."""
+        lines = [f"{'stage':18} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'total s':>9}"]
+        for name, values in sorted(self.durations.items(), key=lambda item: -sum(item[1])):
+            values = sorted(values)
+            lines.append(
+                f"{name:18} {len(values):8d} "
+                + " ".join(f"{percentile(values, p) * 1000:9.1f}" for p in (50, 95, 99))
+                + f" {sum(values):9.2f}"
+            )
+        mb = 1024 * 1024
+        lines.append(
+            f"bytes in {self.totals['bytes_in'] / mb:.1f} MB, bytes out {self.totals['bytes_out'] / mb:.1f} MB, "
+            f"{self.totals['pixels'] / 1e6:.1f} Mpx"
+        )
+        return "\n".join(lines)
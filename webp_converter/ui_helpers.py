@@ -1,13 +1,18 @@
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich import box
-from rich.prompt import Confirm
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_console():
+    """Return the shared rich Console, importing rich on first use."""
+    from rich.console import Console
+    return Console()
 
-console = Console()
 
 def show_success(input_path, output_path, original_size, new_size, quality):
     """Show a beautiful success panel after conversion."""
+    from rich import box
+    from rich.panel import Panel
+    from rich.table import Table
     size_diff = original_size - new_size
     size_percent = (size_diff / original_size) * 100 if original_size > 0 else 0
 
@@ -27,8 +32,8 @@ def show_success(input_path, output_path, original_size, new_size, quality):
     table.add_row("Original Size", format_size(original_size))
     table.add_row("WebP Size", format_size(new_size))
     table.add_row("Saved", f"{format_size(size_diff)} ({size_percent:.1f}%)")
-    table.add_row("Quality", f"{quality}%")
-    console.print(
+    table.add_row("Quality", f"{quality}%" if quality is not None else "lossless")
+    get_console().print(
         Panel(
             table,
             title="[bold green]✓ Conversion Successful![/bold green]",
@@ -38,7 +43,8 @@ def show_success(input_path, output_path, original_size, new_size, quality):
     )
 
 def show_error(message, title="Error"):
-    console.print(
+    from rich.panel import Panel
+    get_console().print(
         Panel(
             f"[red]{message}[/red]",
             title=f"[bold red]❌ {title}[/bold red]",
@@ -48,7 +54,8 @@ def show_error(message, title="Error"):
     )
 
 def show_warning(message, title="Warning"):
-    console.print(
+    from rich.panel import Panel
+    get_console().print(
         Panel(
             f"[yellow]{message}[/yellow]",
             title=f"[bold yellow]⚠️ {title}[/bold yellow]",
@@ -58,7 +65,8 @@ def show_warning(message, title="Warning"):
     )
 
 def show_info(message, title="Info"):
-    console.print(
+    from rich.panel import Panel
+    get_console().print(
         Panel(
             message,
             title=f"[bold blue]ℹ️ {title}[/bold blue]",
@@ -68,5 +76,6 @@ def show_info(message, title="Info"):
     )
 
 def ask_overwrite(filename):
+    from rich.prompt import Confirm
     show_warning(f"Output file '{filename}' already exists.", title="File Exists")
     return Confirm.ask("Overwrite this file?", default=False)
@@ -0,0 +1,150 @@
+"""
+variants.py
+Responsive variant fan-out: many widths/qualities from a single decode, plus a
+srcset-style JSON manifest per image.
+"""
+import os
+import json
+from collections import namedtuple
+from PIL import Image
+from .image_utils import has_transparency, save_image_with_transparency, shrink_on_load
+from .timing import count, stage
+from .writer import write_output
+
+SRCSET_SUFFIX = ".srcset.json"
+
+# width=None means the original size.
+VariantSpec = namedtuple("VariantSpec", ["width", "quality", "lossless"])
+
+
+def parse_variant_specs(text, quality=80, lossless=False):
+    """
+    Parse a comma-separated variant list such as "320,640:70,1280,orig:90,orig:lossless".
+    Each item is WIDTH[:QUALITY][:lossless]; WIDTH is a pixel width or 'orig'.
+    Args:
+        text (str): Variant list.
+        quality (int): Quality for items that do not set one.
+        lossless (bool): Lossless flag for items that do not set one.
+    Returns:
+        list: VariantSpec tuples, without duplicates, in the given order.
+    Raises:
+        ValueError: If an item cannot be parsed.
+    """
+    specs = []
+    for item in text.split(","):
+        parts = [p.strip().lower() for p in item.split(":") if p.strip()]
+        if not parts:
+            continue
+        width = None if parts[0] in ("orig", "original") else int(parts[0])
+        if width is not None and width <= 0:
+            raise ValueError(f"Invalid variant width: {parts[0]}")
+        spec_quality, spec_lossless = quality, lossless
+        for part in parts[1:]:
+            if part == "lossless":
+                spec_lossless = True
+            elif part.isdigit() and 0 <= int(part) <= 100:
+                spec_quality = int(part)
+            else:
+                raise ValueError(f"Invalid variant option '{part}' in '{item}'")
+        spec = VariantSpec(width, spec_quality, spec_lossless)
+        if spec not in specs:
+            specs.append(spec)
+    if not specs:
+        raise ValueError("No variants given.")
+    return specs
+
+
+def srcset_path(output_path):
+    """Return the manifest path for an output like 'out/photo.webp' ('out/photo.srcset.json')."""
+    return os.path.splitext(output_path)[0] + SRCSET_SUFFIX
+
+
+def variant_path(output_base, width, spec):
+    """Name a variant file: '<base>-<width>w-q<quality>.webp' or '<base>-<width>w-lossless.webp'."""
+    encoding = "lossless" if spec.lossless else f"q{spec.quality}"
+    return f"{output_base}-{width}w-{encoding}.webp"
+
+
+def convert_variants(input_path, manifest_path, specs, remove_bg=False, bg_model=None, writer=None):
+    """
+    Decode input_path once and encode every variant in specs, largest first, resizing
+    step by step from the previous (larger) size. Widths above the original are clamped
+    to the original so nothing is upscaled.
+    Args:
+        input_path (str): Path to the input image.
+        manifest_path (str): Where to write the srcset manifest (must end in '.srcset.json');
+            variant files are named after it.
+        specs (list): VariantSpec tuples.
+        remove_bg (bool): If True, remove the background once before resizing.
+        bg_model (str): rembg model used for background removal (None for the default).
+        writer (writer.PendingWrites): Write the files in the background instead of on this thread.
+    Returns:
+        dict: original_size, new_size (total bytes of all variants), bg_skipped and variants.
+    """
+    output_base = manifest_path[: -len(SRCSET_SUFFIX)]
+    bg_skipped = False
+    with Image.open(input_path) as img:
+        original_width, original_height = img.size
+        # Clamp to the original width; specs that collapse onto the same output are encoded once.
+        targets = {}
+        for spec in specs:
+            width = min(spec.width or original_width, original_width)
+            encodings = targets.setdefault(width, [])
+            if spec._replace(width=width) not in encodings:
+                encodings.append(spec._replace(width=width))
+        widths = sorted(targets, reverse=True)
+        first_size = (widths[0], max(1, round(original_height * widths[0] / original_width)))
+        with stage("decode"):
+            current = shrink_on_load(img, first_size) if widths[0] < original_width else img
+            current.load()
+        count(pixels=original_width * original_height, bytes_in=os.path.getsize(input_path))
+        if remove_bg and has_transparency(current):
+            bg_skipped = True
+        elif remove_bg:
+            from .bg_removal import remove_background
+            if current.mode != "RGBA":
+                current = current.convert("RGBA")
+            current = remove_background(current, model_name=bg_model)
+
+        variants = []
+        for width in widths:
+            size = (width, max(1, round(original_height * width / original_width)))
+            if current.size != size:
+                with stage("resize"):
+                    current = current.resize(size, Image.Resampling.LANCZOS)
+            for spec in targets[width]:
+                path = variant_path(output_base, width, spec)
+                size_bytes = save_image_with_transparency(
+                    current, path, format="WEBP", lossless=spec.lossless, writer=writer, quality=spec.quality
+                )
+                variants.append(
+                    {
+                        "file": os.path.basename(path),
+                        "width": size[0],
+                        "height": size[1],
+                        "quality": spec.quality,
+                        "lossless": spec.lossless,
+                        "bytes": size_bytes,
+                    }
+                )
+
+    variants.sort(key=lambda v: (v["width"], not v["lossless"], v["quality"]))
+    # srcset lists one file per width: the highest-quality lossy variant (or lossless if that is all there is).
+    by_width = {}
+    for variant in variants:
+        by_width[variant["width"]] = variant
+    manifest = {
+        "source": os.path.basename(input_path),
+        "width": original_width,
+        "height": original_height,
+        "variants": variants,
+        "srcset": ", ".join(f"{v['file']} {w}w" for w, v in sorted(by_width.items())),
+    }
+    write_output(manifest_path, json.dumps(manifest, indent=2).encode("utf-8"), writer)
+    count(bytes_out=sum(v["bytes"] for v in variants))
+    return {
+        "original_size": os.path.getsize(input_path),
+        "new_size": sum(v["bytes"] for v in variants),
+        "bg_skipped": bg_skipped,
+        "variants": [v["file"] for v in variants],
+    }
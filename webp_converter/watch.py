@@ -0,0 +1,533 @@
+"""
+watch.py
+Watch-folder daemon: converts images as they land in a folder tree. Uses inotify
+on Linux (through ctypes, no extra dependency) and falls back to polling folder
+mtimes elsewhere. Files are converted once their size and mtime have settled.
+"""
+import os
+import sys
+import json
+import time
+import errno
+import struct
+import select
+import signal
+import argparse
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from .batch import _status
+from .dashboard import format_bytes
+from .links import LINK_MODES
+from .parallel import CONVERT_MODE, _init_worker, _run_chunk
+from .threads import plan_threads
+from .scanner import _is_image_name, image_extensions, output_path_for, scan_images
+
+# inotify(7) constants.
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR
+_EVENT = struct.Struct("iIII")
+# Times a file is queued again after its worker died before it is reported as failed
+# (so a file that always kills its worker cannot crash-loop the daemon).
+WORKER_RETRIES = 1
+
+
+def _walk_dirs(root):
+    """Yield root and every folder below it (symlinked folders are not followed)."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        yield directory
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def _list_dir(directory):
+    """Return (image files, subfolders) directly inside directory."""
+    extensions = image_extensions()
+    images, subdirs = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif _is_image_name(entry.name, extensions) and entry.is_file():
+                        images.append(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return images, subdirs
+
+
+class InotifyWatcher:
+    """
+    Recursive inotify watch. read() returns image paths that were created, closed
+    after writing or moved in; folders created later are watched as they appear.
+    Raises OSError if inotify is unavailable (e.g. not Linux, or out of watches).
+    """
+
+    def __init__(self, root):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = root
+        self.overflowed = False
+        self._dirs = {}
+        self._extensions = image_extensions()
+        try:
+            for directory in _walk_dirs(root):
+                self._add(directory)
+        except OSError:
+            self.close()
+            raise
+
+    def _add(self, directory):
+        import ctypes
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return False
+            raise OSError(err, f"Cannot watch {directory}: {os.strerror(err)}")
+        self._dirs[wd] = directory
+        return True
+
+    def read(self, timeout=None):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = _EVENT.unpack_from(buf, offset)
+            name = buf[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                # Files can land in a new folder before its watch exists; pick them up too.
+                for subdir in _walk_dirs(path):
+                    if self._add(subdir):
+                        paths.extend(_list_dir(subdir)[0])
+            elif _is_image_name(path, self._extensions):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """
+    Portable fallback: every interval, stat the known folders and list only those
+    whose mtime changed (a file created or moved in changes its folder's mtime).
+    Of those folders' images, read() returns the ones whose output is missing or older.
+    """
+
+    def __init__(self, root, is_stale, interval=1.0):
+        self.root = root
+        self.is_stale = is_stale
+        self.interval = interval
+        self.overflowed = False
+        self._dirs = {}
+        for directory in _walk_dirs(root):
+            self._remember(directory)
+        self._next = time.monotonic() + interval
+
+    def _remember(self, directory):
+        try:
+            self._dirs[directory] = os.stat(directory).st_mtime_ns
+            return True
+        except OSError:
+            self._dirs.pop(directory, None)
+            return False
+
+    def read(self, timeout=None):
+        wait_for = self._next - time.monotonic()
+        if timeout is not None and timeout < wait_for:
+            time.sleep(max(timeout, 0))
+            return []
+        time.sleep(max(wait_for, 0))
+        self._next = time.monotonic() + self.interval
+        paths = []
+        for directory, mtime in list(self._dirs.items()):
+            try:
+                changed = os.stat(directory).st_mtime_ns != mtime
+            except OSError:
+                del self._dirs[directory]
+                continue
+            if not changed:
+                continue
+            self._remember(directory)
+            images, subdirs = _list_dir(directory)
+            paths.extend(p for p in images if self.is_stale(p))
+            for subdir in subdirs:
+                if subdir in self._dirs:
+                    continue
+                for new_dir in _walk_dirs(subdir):
+                    self._remember(new_dir)
+                    paths.extend(p for p in _list_dir(new_dir)[0] if self.is_stale(p))
+        return paths
+
+    def close(self):
+        pass
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Debouncer:
+    """
+    Holds changed paths until their size and mtime have stayed the same for `settle`
+    seconds, so half-written uploads are not converted. Only paths still settling are kept.
+    """
+
+    def __init__(self, settle=0.3):
+        self.settle = settle
+        self.pending = {}
+
+    def add(self, path, now=None):
+        now = time.monotonic() if now is None else now
+        self.pending[path] = (_signature(path), now)
+
+    def ready(self, now=None):
+        """Return (and forget) the paths that have settled; vanished files are dropped."""
+        now = time.monotonic() if now is None else now
+        settled = []
+        for path, (signature, since) in list(self.pending.items()):
+            current = _signature(path)
+            if current is None:
+                del self.pending[path]
+            elif current != signature:
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self.pending[path]
+                settled.append(path)
+        return settled
+
+
+def _init_watch_worker(*args):
+    # Ctrl-C reaches the whole process group; the daemon shuts the workers down itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(*args)
+
+
+def is_stale(input_path, output_path):
+    """Return True if output_path is missing or older than input_path."""
+    try:
+        return os.stat(output_path).st_mtime_ns < os.stat(input_path).st_mtime_ns
+    except OSError:
+        return True
+
+
+def watch(root, output_dir, on_result, workers=None, settle=0.3, poll=None, catch_up=True,
+          tick=0.1, stop=None, ort_threads=None, **options):
+    """
+    Convert images under root into output_dir as they appear, until stop() returns
+    True (or forever).
+    Args:
+        root (str): Folder to watch (recursively).
+        output_dir (str): Where outputs go; the folder structure below root is kept.
+        on_result (callable): Called with every result record (see parallel.process_file).
+        workers (int): Worker processes, started once and kept warm.
+        settle (float): Seconds a file's size and mtime must stay unchanged.
+        poll (float): Poll every this many seconds instead of using inotify.
+            None uses inotify where available and polls every second otherwise.
+        catch_up (bool): First convert images whose output is missing or older
+            (streamed from a scan of root as workers free up).
+        tick (float): How often settling files and finished batches are checked.
+        stop (callable): Checked every tick; return True to stop.
+        ort_threads (int): onnxruntime threads per worker (see threads.plan_threads).
+        options: quality, lossless, remove_bg, bg_model, link and the other
+            process_file options.
+    """
+    threads = plan_threads(workers, ort_threads, bg_share=1.0 if options.get("remove_bg") else 0.0)
+    workers = threads["workers"]
+    root = os.path.abspath(root)
+    output_dir = os.path.abspath(output_dir)
+
+    def output_for(path):
+        return output_path_for(path, output_dir, root)
+
+    def wanted(path):
+        # The output tree may live inside the watched one; never feed outputs back in.
+        return not (path + os.sep).startswith(output_dir + os.sep)
+
+    def stale(path):
+        return wanted(path) and is_stale(path, output_for(path)[0])
+
+    watcher = None
+    if poll is None:
+        try:
+            watcher = InotifyWatcher(root)
+        except OSError as e:
+            print(f"inotify unavailable ({e}); polling every second instead.", file=sys.stderr)
+            poll = 1.0
+    if watcher is None:
+        watcher = PollingWatcher(root, stale, interval=poll)
+    debouncer = Debouncer(settle)
+    busy = {}  # input path -> signature when it was handed to a worker
+    in_flight = {}
+    max_in_flight = workers * 2
+    # Settled paths waiting for a worker. Stale files found by catch-up or a rescan
+    # are pulled from the scanner only as the backlog drains, so a large tree never
+    # has all its paths in memory at once.
+    backlog = {}
+    backlog_limit = max_in_flight * 16
+
+    def stale_paths():
+        return (p for p in scan_images(root, exclude=(output_dir,)) if p not in busy and stale(p))
+
+    rescan = stale_paths() if catch_up else None
+
+    def refill():
+        nonlocal rescan
+        while rescan is not None and len(backlog) < backlog_limit:
+            path = next(rescan, None)
+            if path is None:
+                rescan = None
+            else:
+                backlog[path] = None
+    crashes = {}  # input path -> times its worker died under it
+
+    def start_pool():
+        # Spawn (not fork): forking after rembg/onnxruntime are loaded deadlocks at exit.
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_watch_worker,
+            initargs=(options.get("remove_bg", False), options.get("bg_model"), False, options.get("max_pixels"),
+                      threads),
+        )
+
+    pool = start_pool()
+
+    def restart():
+        nonlocal pool
+        pool.shutdown(wait=False)
+        pool = start_pool()
+
+    def submit(chunk):
+        try:
+            in_flight[pool.submit(_run_chunk, chunk)] = (chunk, pool)
+        except BrokenProcessPool:
+            # A worker died since the last result; the pool takes no more work.
+            restart()
+            in_flight[pool.submit(_run_chunk, chunk)] = (chunk, pool)
+
+    def worker_died(chunk, error):
+        # Queue the chunk's files again (a file that keeps killing workers fails instead).
+        for input_path, output_path, action, _, _ in chunk:
+            busy.pop(input_path, None)
+            crashes[input_path] = crashes.get(input_path, 0) + 1
+            if crashes[input_path] <= WORKER_RETRIES:
+                backlog[input_path] = None
+            else:
+                del crashes[input_path]
+                on_result({"input": input_path, "output": output_path, "action": action,
+                           "error": f"Worker failed: {error}"})
+
+    try:
+        while stop is None or not stop():
+            idle = not (debouncer.pending or backlog or in_flight or rescan is not None)
+            for path in watcher.read(None if idle and stop is None else tick):
+                if wanted(path):
+                    debouncer.add(path)
+            if watcher.overflowed:
+                # Events were lost; recover with one staleness pass over the tree
+                # (restarting any pass still in progress).
+                watcher.overflowed = False
+                rescan = stale_paths()
+            for path in debouncer.ready():
+                if path in busy:
+                    debouncer.add(path)  # changed again while converting; convert once more after
+                else:
+                    backlog[path] = None
+            if in_flight:
+                done, _ = wait(in_flight, timeout=0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk, chunk_pool = in_flight.pop(future)
+                    try:
+                        results = future.result()
+                    except BrokenProcessPool as e:
+                        # A worker died (e.g. out of memory) and took the pool with it.
+                        if chunk_pool is pool:
+                            restart()
+                        worker_died(chunk, e)
+                        continue
+                    except Exception as e:
+                        results = [
+                            {"input": i, "output": o, "action": a, "error": f"Worker failed: {e}"}
+                            for i, o, a, _, _ in chunk
+                        ]
+                    for result in results:
+                        crashes.pop(result["input"], None)
+                        submitted = busy.pop(result["input"], None)
+                        if result["error"] is not None and _signature(result["input"]) != submitted:
+                            # Still being written after it had settled; try the new content.
+                            debouncer.add(result["input"])
+                            continue
+                        on_result(result)
+            # Coalesce whatever has settled into chunks spread over the idle workers.
+            refill()
+            while backlog and len(in_flight) < max_in_flight:
+                size = max(1, min(16, -(-len(backlog) // workers)))
+                chunk = []
+                for path in list(islice(backlog, size)):
+                    del backlog[path]
+                    busy[path] = _signature(path)
+                    chunk.append((path, *output_for(path), CONVERT_MODE, options))
+                submit(chunk)
+                refill()
+    finally:
+        watcher.close()
+        for future in in_flight:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="webp-convert watch",
+        description="Convert images to WebP as they are added to a folder.",
+        epilog="Example: webp-convert watch uploads/ -o public/img --quality 75",
+    )
+    parser.add_argument("folder", help="Folder to watch (recursively)")
+    parser.add_argument("-o", "--output-dir", required=True, help="Output directory (folder structure is kept)")
+    parser.add_argument("-q", "--quality", type=int, default=80, help="WebP quality 0-100 (default: 80)")
+    parser.add_argument("--lossless", action="store_true", help="Use lossless WebP")
+    parser.add_argument("--remove-bg", action="store_true", help="Remove image backgrounds (uses AI)")
+    parser.add_argument("--bg-model", help="rembg model for --remove-bg (default: rembg's default)")
+    parser.add_argument(
+        "--link",
+        choices=tuple(LINK_MODES),
+        default="auto",
+        help="How WebP inputs are placed in the output (see webp-convert batch --help)",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=0.3,
+        metavar="SECONDS",
+        help="Wait until a file's size and mtime have not changed for this long (default: 0.3)",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        metavar="SECONDS",
+        help="Poll folders at this interval instead of using inotify",
+    )
+    parser.add_argument(
+        "--no-catch-up",
+        dest="catch_up",
+        action="store_false",
+        help="Do not convert images that were already there (or changed) while not watching",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int,
+        help="Number of worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "--ort-threads", type=int, metavar="N",
+        help="onnxruntime threads per worker for background removal "
+        "(default: the cores left per worker; without --workers, runs CPU count / N workers)",
+    )
+    parser.add_argument("--json", action="store_true", help="Print one JSON record per file instead of a log line")
+    return parser
+
+
+def _print_result(result, as_json):
+    result.pop("trace", None)
+    result["status"] = _status(result)
+    if as_json:
+        print(json.dumps(dict(type="file", **result)), flush=True)
+    elif result["error"] is not None:
+        print(f"error     {result['input']}: {result['error']}", file=sys.stderr, flush=True)
+    else:
+        sizes = ""
+        if "new_size" in result:
+            sizes = f" ({format_bytes(result['original_size'])} -> {format_bytes(result['new_size'])})"
+        print(f"{result['status']:<9} {result['input']} -> {result['output']}{sizes}", flush=True)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not 0 <= args.quality <= 100:
+        parser.error("--quality must be between 0 and 100")
+    for flag in ("workers", "ort_threads"):
+        if getattr(args, flag) is not None and getattr(args, flag) < 1:
+            parser.error(f"--{flag.replace('_', '-')} must be at least 1")
+    if args.settle < 0:
+        parser.error("--settle must be 0 or more")
+    if args.poll is not None and args.poll <= 0:
+        parser.error("--poll must be more than 0")
+    if not os.path.isdir(args.folder):
+        parser.error(f"{args.folder} is not a folder")
+    os.makedirs(args.output_dir, exist_ok=True)
+    # Stop the same way on SIGTERM (service managers) as on Ctrl-C.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Watching {args.folder} (Ctrl-C to stop)", file=sys.stderr)
+    try:
+        watch(
+            args.folder,
+            args.output_dir,
+            lambda result: _print_result(result, args.json),
+            workers=args.workers,
+            ort_threads=args.ort_threads,
+            settle=args.settle,
+            poll=args.poll,
+            catch_up=args.catch_up,
+            quality=args.quality,
+            lossless=args.lossless,
+            remove_bg=args.remove_bg,
+            bg_model=args.bg_model,
+            link=args.link,
+        )
+    except KeyboardInterrupt:
+        pass
+    return 0
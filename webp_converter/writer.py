@@ -0,0 +1,150 @@
+"""
+writer.py
+Atomic output writes (temp file + os.replace) and a small background I/O thread pool,
+so encoding the next image overlaps writing the previous one and readers of the
+output tree never see a half-written file.
+"""
+import os
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .timing import current_trace, resume, stage
+
+_temp_ids = itertools.count()
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where folders cannot be opened
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def temp_path(path):
+    """Return a unique hidden temp path next to path (same folder, so os.replace is atomic)."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.{next(_temp_ids)}.tmp")
+
+
+def remove_stale_temps(path):
+    """Delete temp files left next to path by writes that were interrupted (see temp_path)."""
+    import glob
+    directory, name = os.path.split(path)
+    for stale in glob.glob(os.path.join(glob.escape(directory or "."), f".{glob.escape(name)}.*.tmp")):
+        try:
+            os.remove(stale)
+        except OSError:
+            pass
+
+
+def atomic_write(path, data, fsync=False, mtime_ns=None):
+    """
+    Write data to path through a temp file in the same folder and os.replace.
+    Args:
+        path (str): Destination file.
+        data (bytes): File contents.
+        fsync (bool): If True, flush the data to disk before the rename.
+        mtime_ns (int): If set, give the file this modification time before the rename.
+    """
+    tmp_path = temp_path(path)
+    # os.open (not mkstemp) so the file gets the usual umask-based permissions.
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if mtime_ns is not None:
+            os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_output(path, data, writer=None, mtime_ns=None):
+    """Write data atomically, on the calling thread or through writer (see PendingWrites)."""
+    if writer is not None:
+        writer.write(path, data, mtime_ns)
+        return
+    with stage("write"):
+        atomic_write(path, data, mtime_ns=mtime_ns)
+
+
+class AsyncWriter:
+    """
+    Writes files atomically on a small thread pool. write() returns a Future right
+    away and only blocks while max_pending writes are already queued, which bounds
+    the memory held by encoded buffers.
+    With fsync, each file is synced before its rename and the folders written to are
+    synced once per fsync_batch files and on sync_dirs()/close().
+    """
+
+    def __init__(self, threads=2, fsync=False, fsync_batch=64, max_pending=8):
+        self.fsync = fsync
+        self.fsync_batch = fsync_batch
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="webp-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._dirs = set()
+        self._unsynced = 0
+
+    def write(self, path, data, mtime_ns=None):
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._write, path, data, mtime_ns, current_trace())
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _write(self, path, data, mtime_ns, trace):
+        with resume(trace), stage("write"):
+            atomic_write(path, data, fsync=self.fsync, mtime_ns=mtime_ns)
+        if self.fsync:
+            with self._lock:
+                self._dirs.add(os.path.dirname(path) or ".")
+                self._unsynced += 1
+                if self._unsynced < self.fsync_batch:
+                    return
+            self.sync_dirs()
+
+    def sync_dirs(self):
+        """Sync the folders written to since the last call, so the renames are durable."""
+        with self._lock:
+            dirs, self._dirs, self._unsynced = self._dirs, set(), 0
+        for directory in dirs:
+            _fsync_dir(directory)
+
+    def close(self):
+        """Wait for queued writes to finish."""
+        self._pool.shutdown(wait=True)
+        if self.fsync:
+            self.sync_dirs()
+
+
+class PendingWrites:
+    """Collects one job's writes to an AsyncWriter so its result can wait for them."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.futures = []
+
+    def write(self, path, data, mtime_ns=None):
+        self.futures.append(self.writer.write(path, data, mtime_ns))
+
+    def wait(self):
+        """Wait for every write and return the first error message (None if all succeeded)."""
+        errors = [str(e) for e in (f.exception() for f in self.futures) if e is not None]
+        return errors[0] if errors else None